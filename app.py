@@ -1,16 +1,101 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, request
+from cache_manager import CACHE_DURATIONS, cache_timestamp, load_cache
 from utils import fetch_and_decode_data
-import json
+import gzip
+import hashlib
+import logging
+import os
+import orjson
+import time
+
+# Log level comes from the environment; library modules never configure logging
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
 
 app = Flask(__name__)
 
+# Serialized /api body, its ETag and its gzip-encoded form, keyed by the
+# processed_data object they were built from. The cache layer hands back
+# the same object until the cache file changes, so repeat requests reuse
+# the bytes instead of re-serializing and re-compressing.
+_payload = (None, None, None, None)
+
+# The body is compressed once per dataset, so a higher level is affordable
+GZIP_LEVEL = 6
+
+# Clients may reuse a response for as long as the data cache is valid
+DATA_MAX_AGE = int(CACHE_DURATIONS['data'].total_seconds())
+
+def data_max_age():
+    """Seconds left before the data cache expires, for Cache-Control.
+
+    A cache the process has not read back yet was just written by the
+    refresh serving this request, so it has its whole lifetime ahead.
+    """
+    ts = cache_timestamp()
+    if ts is None:
+        return DATA_MAX_AGE
+    return max(0, int(DATA_MAX_AGE - (time.time() - ts)))
+
+class ORJSONResponse(Response):
+    default_mimetype = 'application/json'
+
+def orjsonify(data):
+    """Serialize data with orjson and wrap it in a JSON response."""
+    return ORJSONResponse(orjson.dumps(data))
+
+def serialized_payload(processed_data, gzip_encoded=False):
+    """Return (JSON bytes, ETag) for processed_data, reusing the last result.
+
+    With gzip_encoded the bytes are the gzip-compressed body and the ETag
+    identifies that encoding.
+    """
+    global _payload
+    source, body, etag, gzipped = _payload
+    if source is not processed_data:
+        body = orjson.dumps(processed_data)
+        etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        gzipped = None
+    if gzip_encoded and gzipped is None:
+        gzipped = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    _payload = (processed_data, body, etag, gzipped)
+
+    if gzip_encoded:
+        return gzipped, f"{etag}-gzip"
+    return body, etag
+
+def warm_cache():
+    """Load the data cache and build the response bodies before any request.
+
+    Only reads what is already cached on disk; a missing or expired cache
+    is left for the first request to refresh. Under gunicorn's preload_app
+    this runs once in the master and forked workers share the result.
+    """
+    try:
+        cached_data = load_cache()
+        if cached_data and 'processed_data' in cached_data:
+            serialized_payload(cached_data['processed_data'], gzip_encoded=True)
+    except Exception as e:
+        app.logger.error(f"Error warming cache: {str(e)}")
+
 @app.route('/api', methods=['GET'], strict_slashes=False)
 def get_data():
+    use_gzip = request.accept_encodings.quality('gzip') > 0
     try:
         data = fetch_and_decode_data()
-        return jsonify(data['processed_data'])
+        body, etag = serialized_payload(data['processed_data'], gzip_encoded=use_gzip)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return orjsonify({'error': str(e)}), 500
+
+    response = ORJSONResponse(body)
+    if use_gzip:
+        response.content_encoding = 'gzip'
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = data_max_age()
+    return response.make_conditional(request)
+
+warm_cache()
 
 if __name__ == '__main__':
     app.run(port=5000, debug=False)
@@ -1,53 +1,172 @@
-import json
+import mmap
+import orjson
 import os
+import pickle
+import threading
+import time
+import zstandard
 from datetime import datetime, timedelta
 import logging
 
 logger = logging.getLogger(__name__)
 
-CACHE_FILE = 'data_cache.json'
-TICKER_CACHE_FILE = 'ticker_cache.json'
+CACHE_FILE = 'data_cache.pkl'
+TICKER_CACHE_FILE = 'ticker_cache.pkl'
+# The full Glide snapshot is kept apart from the processed companies so
+# that serving the API never has to decode it
+RAW_CACHE_FILE = 'raw_cache.pkl'
+
+# JSON caches from before the switch to pickle. They are only read, and
+# only when the pickle cache for that type does not exist yet.
+LEGACY_CACHE_FILE = 'data_cache.json'
+LEGACY_TICKER_CACHE_FILE = 'ticker_cache.json'
 
 # Cache durations for different types
 CACHE_DURATIONS = {
     'data': timedelta(days=1),
-    'ticker': timedelta(days=9999)  # don't expire
+    'ticker': timedelta(days=9999),  # don't expire
+    'raw': timedelta(days=1)
 }
 
+# Compression level for cache files; level 3 keeps saves fast while
+# still shrinking the JSON-heavy payload several times over
+CACHE_COMPRESSION_LEVEL = 3
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+# Parsed cache contents kept in-process, keyed by cache file path.
+# Each entry is (file signature, cached epoch time, data) and is reused
+# as long as the file's mtime and size are unchanged.
+_memory_cache = {}
+_memory_lock = threading.Lock()
+
+# Serializes cache writers within this process; they share a temp file
+# name per cache file. Readers need no lock because files are replaced
+# atomically.
+_write_lock = threading.Lock()
+
+def _decode_cache(buf):
+    """Decode cache file contents, accepting both pickle and legacy JSON."""
+    if buf[:4] == ZSTD_MAGIC:
+        buf = zstandard.ZstdDecompressor().decompress(buf)
+    # Pickle protocol 2+ streams start with the PROTO opcode, which can
+    # never begin a JSON document
+    if buf[:1] == b'\x80':
+        return pickle.loads(buf)
+    return orjson.loads(buf)
+
+def _cache_files(cache_type):
+    """Return (cache file, legacy JSON file or None) for a cache type."""
+    if cache_type == 'ticker':
+        return TICKER_CACHE_FILE, LEGACY_TICKER_CACHE_FILE
+    if cache_type == 'raw':
+        return RAW_CACHE_FILE, None  # never had a JSON predecessor
+    return CACHE_FILE, LEGACY_CACHE_FILE
+
+def _existing_cache_file(cache_type):
+    """Return the cache file to read for a cache type, or None if there is none."""
+    cache_file, legacy_file = _cache_files(cache_type)
+    if os.path.exists(cache_file):
+        return cache_file
+    if legacy_file is not None and os.path.exists(legacy_file):
+        return legacy_file
+    return None
+
+def cache_timestamp(cache_type='data'):
+    """Return the epoch time the cache was written, as last seen by load_cache.
+
+    Only the in-process copy is consulted, so this never decodes the file.
+    Returns None when load_cache has not read the current file, for instance
+    right after save_cache replaced it.
+    """
+    cache_file = _existing_cache_file(cache_type)
+    if cache_file is None:
+        return None
+    try:
+        st = os.stat(cache_file)
+    except OSError:
+        return None
+    with _memory_lock:
+        entry = _memory_cache.get(cache_file)
+    if entry is None or entry[0] != (st.st_mtime_ns, st.st_size):
+        return None
+    return entry[1]
+
 def load_cache(cache_type='data'):
     """Load data from cache if it exists and is not expired."""
-    cache_file = TICKER_CACHE_FILE if cache_type == 'ticker' else CACHE_FILE
+    cache_file = _existing_cache_file(cache_type)
     cache_duration = CACHE_DURATIONS.get(cache_type, timedelta(days=1))  # default to 1 day if type not found
     
-    if not os.path.exists(cache_file):
+    if cache_file is None:
         return None
         
     try:
-        with open(cache_file, 'r') as f:
-            cache = json.load(f)
+        st = os.stat(cache_file)
+        signature = (st.st_mtime_ns, st.st_size)
+
+        with _memory_lock:
+            entry = _memory_cache.get(cache_file)
+
+        if entry is not None and entry[0] == signature:
+            _, cached_time, data = entry
+        else:
+            # Decode straight from the mapped file rather than copying it
+            # into a bytes object first
+            with open(cache_file, 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                    memoryview(mm) as view:
+                st = os.fstat(f.fileno())
+                signature = (st.st_mtime_ns, st.st_size)
+                cache = _decode_cache(view)
+            if 'ts' in cache:
+                cached_time = cache['ts']
+            else:
+                # Caches written before epoch timestamps store an ISO string
+                cached_time = datetime.fromisoformat(cache['timestamp']).timestamp()
+            data = cache['data']
+            with _memory_lock:
+                _memory_cache[cache_file] = (signature, cached_time, data)
             
         # Check if cache is expired
-        cached_time = datetime.fromisoformat(cache['timestamp'])
-        if datetime.now() - cached_time > cache_duration:
+        if time.time() - cached_time > cache_duration.total_seconds():
             logger.info(f"{cache_type} cache has expired (duration: {cache_duration})")
             return None
             
         logger.info(f"Using cached {cache_type} data")
-        return cache['data']
+        return data
     except Exception as e:
         logger.error(f"Error loading {cache_type} cache: {str(e)}")
         return None
 
 def save_cache(data, cache_type='data'):
-    """Save data to cache with current timestamp."""
+    """Save data to cache with current timestamp.
+
+    The cache is written to a temporary file and renamed over the old one,
+    so readers and crashes never leave a half-written cache behind.
+    """
     try:
-        cache_file = TICKER_CACHE_FILE if cache_type == 'ticker' else CACHE_FILE
+        cache_file, _ = _cache_files(cache_type)
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
         cache = {
-            'timestamp': datetime.now().isoformat(),
+            'ts': time.time(),
             'data': data
         }
-        with open(cache_file, 'w') as f:
-            json.dump(cache, f)
+        compressor = zstandard.ZstdCompressor(level=CACHE_COMPRESSION_LEVEL)
+        payload = compressor.compress(pickle.dumps(cache, protocol=5))
+        with _write_lock:
+            try:
+                with open(tmp_file, 'wb') as f:
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_file, cache_file)
+            except BaseException:
+                try:
+                    os.remove(tmp_file)
+                except OSError:
+                    pass
+                raise
+        with _memory_lock:
+            _memory_cache.pop(cache_file, None)
         logger.info(f"{cache_type} data cached successfully")
     except Exception as e:
         logger.error(f"Error saving {cache_type} cache: {str(e)}")
@@ -6,8 +6,10 @@ backlog = 2048
 
 # Worker processes
 workers = multiprocessing.cpu_count() * 2 + 1
-worker_class = 'sync'
-worker_connections = 1000
+worker_class = 'gthread'
+# Concurrent requests per worker; worker_connections only applies to the
+# eventlet/gevent workers, so it is not set
+threads = 4
 timeout = 30
 keepalive = 2
 
@@ -20,6 +22,7 @@ loglevel = 'info'
 proc_name = 'watermelon-api'
 
 # Server mechanics
+preload_app = True  # load the app (and its caches) once, share with forked workers
 daemon = False
 pidfile = None
 umask = 0
@@ -0,0 +1,121 @@
+"""Shared fixtures.
+
+The suite runs under pytest-xdist, so tests must not leave state in module
+globals: anything they touch beyond what the autouse fixtures below reset
+has to be patched with monkeypatch or unittest.mock.
+"""
+import pytest
+import requests
+import utils
+
+
+# Chat-completion message contents shared by the ticker lookup tests
+_COMPLETION_CONTENTS = {
+    'aapl': 'AAPL',
+    'alizf': 'ALIZF',
+    'null': 'null',
+    'invalid': '123INVALID',
+    'abb_sentence': 'The stock ticker symbol for ABB Group in the US OTC market is ABBNY.',
+    'allianz_sentence': 'The stock ticker symbol for Allianz in the US OTC markets is ALIZF.',
+    'batch_apple': '{"tickers": [{"name": "Apple Inc.", "ticker": "AAPL"}]}',
+}
+
+
+class _FakeResponse:
+    """Successful HTTP response stand-in without Mock's attribute machinery"""
+    __slots__ = ('_payload', 'content')
+
+    def __init__(self, payload=None, content=b''):
+        self._payload = payload
+        self.content = content
+
+    def json(self):
+        return self._payload
+
+    def raise_for_status(self):
+        return None
+
+
+def _completion(content):
+    """Chat-completion API payload whose single choice says content"""
+    return {'choices': [{'message': {'content': content}}]}
+
+
+@pytest.fixture(scope="session")
+def make_completion():
+    """Build a chat-completion payload for content not in the canned set"""
+    return _completion
+
+
+@pytest.fixture(scope="session")
+def completion_payloads():
+    """Canonical chat-completion payloads, built once per session"""
+    return {name: _completion(content) for name, content in _COMPLETION_CONTENTS.items()}
+
+
+@pytest.fixture(scope="session")
+def completion_responses(completion_payloads):
+    """HTTP responses carrying the canonical payloads, built once per session"""
+    return {name: _FakeResponse(payload) for name, payload in completion_payloads.items()}
+
+
+@pytest.fixture(scope="session")
+def flask_app():
+    """Import and configure the Flask app once per session, on first use"""
+    from app import app
+    app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture(autouse=True)
+def _isolated_cache_dir(tmp_path, monkeypatch):
+    """Run every test from its own directory so cache files never leak
+
+    The cache file names are relative, so this keeps each test (and each
+    xdist worker) off the repository's committed caches and off the files
+    written by other tests.
+    """
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture(autouse=True)
+def _clear_search_cache():
+    """Start every test without memoized Perplexity responses or OpenRouter parses"""
+    utils.clear_search_cache()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def _reset_ticker_cache():
+    """Start every test with an empty, clean in-memory ticker cache
+
+    The dirty flag is also cleared afterwards so the atexit flush never
+    writes a test's lookups to disk.
+    """
+    utils.ticker_cache = {}
+    utils._ticker_dirty = False
+    yield
+    utils._ticker_dirty = False
+
+
+@pytest.fixture
+def http_stub(monkeypatch):
+    """Route the utils HTTP session's get/post through a dict keyed by (method, url)
+
+    Tests register a JSON payload (dict) or a raw body (bytes) per route;
+    unregistered URLs raise a ConnectionError as an unreachable host would.
+    """
+    routes = {}
+
+    def dispatch(method, url):
+        try:
+            body = routes[(method, url)]
+        except KeyError:
+            raise requests.exceptions.ConnectionError(f"No stub for {method} {url}") from None
+        if isinstance(body, bytes):
+            return _FakeResponse(content=body)
+        return _FakeResponse(body)
+
+    monkeypatch.setattr(utils._session, "post", lambda url, **kwargs: dispatch("POST", url))
+    monkeypatch.setattr(utils._session, "get", lambda url, **kwargs: dispatch("GET", url))
+    yield routes
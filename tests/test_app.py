@@ -1,18 +1,17 @@
 import pytest
+import gzip
 import json
+import orjson
 from unittest.mock import patch, Mock
-from app import app
 
 
 class TestFlaskApp:
     """Test suite for Flask application"""
 
-    @pytest.fixture
-    def client(self):
-        """Create test client"""
-        app.config['TESTING'] = True
-        with app.test_client() as client:
-            yield client
+    @pytest.fixture(scope="class")
+    def client(self, flask_app):
+        """Test client shared by every test in the class"""
+        return flask_app.test_client()
 
     @pytest.fixture
     def sample_processed_data(self):
@@ -150,13 +149,13 @@ class TestFlaskApp:
         data = json.loads(response.data)
         assert 'error' in data
 
-    def test_app_configuration(self):
+    def test_app_configuration(self, flask_app):
         """Test Flask app configuration"""
-        assert app.name == 'app'
+        assert flask_app.name == 'app'
         
         # Test that debug is False in production
-        with app.app_context():
-            assert not app.debug
+        with flask_app.app_context():
+            assert not flask_app.debug
 
     @patch('app.fetch_and_decode_data')
     def test_response_headers(self, mock_fetch, client, sample_processed_data):
@@ -200,3 +199,135 @@ class TestFlaskApp:
         assert len(data) == 1000
         assert data[0]['companyName'] == 'Company 0'
         assert data[999]['companyName'] == 'Company 999'
+
+    @patch('app.fetch_and_decode_data')
+    def test_payload_serialized_once_per_dataset(self, mock_fetch, client, sample_processed_data):
+        """Test repeated requests for the same data reuse the serialized body"""
+        mock_fetch.return_value = {
+            'data': {'raw': 'data'},
+            'processed_data': sample_processed_data
+        }
+
+        with patch('app.orjson.dumps', wraps=orjson.dumps) as mock_dumps:
+            first = client.get('/api')
+            second = client.get('/api')
+
+        assert first.data == second.data
+        assert json.loads(second.data) == sample_processed_data
+        mock_dumps.assert_called_once()
+
+    @patch('app.fetch_and_decode_data')
+    def test_caching_headers(self, mock_fetch, client, sample_processed_data):
+        """Test responses carry an ETag and a public Cache-Control header"""
+        mock_fetch.return_value = {
+            'data': {'raw': 'data'},
+            'processed_data': sample_processed_data
+        }
+
+        response = client.get('/api')
+
+        assert response.status_code == 200
+        assert response.headers['ETag']
+        assert response.cache_control.public
+        assert response.cache_control.max_age == 86400
+
+    @pytest.mark.parametrize("age, expected_max_age", [
+        (23 * 3600, 3600),      # An hour of cache lifetime left
+        (2 * 86400, 0),         # Past its lifetime; never negative
+    ])
+    @patch('app.fetch_and_decode_data')
+    def test_max_age_counts_down_with_cache_age(self, mock_fetch, client, sample_processed_data,
+                                               age, expected_max_age):
+        """Test Cache-Control max-age is the data cache's remaining lifetime"""
+        mock_fetch.return_value = {'processed_data': sample_processed_data}
+        now = 1_700_000_000.0
+
+        with patch('app.cache_timestamp', return_value=now - age), \
+                patch('app.time.time', return_value=now):
+            response = client.get('/api')
+
+        assert response.cache_control.max_age == expected_max_age
+
+    @patch('app.fetch_and_decode_data')
+    def test_conditional_request_not_modified(self, mock_fetch, client, sample_processed_data):
+        """Test a matching If-None-Match returns 304 with no body"""
+        mock_fetch.return_value = {
+            'data': {'raw': 'data'},
+            'processed_data': sample_processed_data
+        }
+
+        etag = client.get('/api').headers['ETag']
+        response = client.get('/api', headers={'If-None-Match': etag})
+
+        assert response.status_code == 304
+        assert response.data == b''
+
+    @patch('app.fetch_and_decode_data')
+    def test_conditional_request_stale_etag(self, mock_fetch, client, sample_processed_data):
+        """Test a non-matching If-None-Match returns the full body"""
+        mock_fetch.return_value = {
+            'data': {'raw': 'data'},
+            'processed_data': sample_processed_data
+        }
+
+        response = client.get('/api', headers={'If-None-Match': '"stale"'})
+
+        assert response.status_code == 200
+        assert json.loads(response.data) == sample_processed_data
+
+    @patch('app.fetch_and_decode_data')
+    def test_gzip_response(self, mock_fetch, client, sample_processed_data):
+        """Test the body is gzip-encoded when the client accepts it"""
+        mock_fetch.return_value = {
+            'data': {'raw': 'data'},
+            'processed_data': sample_processed_data
+        }
+
+        response = client.get('/api', headers={'Accept-Encoding': 'gzip, deflate'})
+
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert json.loads(gzip.decompress(response.data)) == sample_processed_data
+
+    @patch('app.fetch_and_decode_data')
+    def test_identity_response_without_accept_encoding(self, mock_fetch, client, sample_processed_data):
+        """Test the body is sent uncompressed unless gzip is accepted"""
+        mock_fetch.return_value = {
+            'data': {'raw': 'data'},
+            'processed_data': sample_processed_data
+        }
+
+        plain = client.get('/api')
+        gzipped = client.get('/api', headers={'Accept-Encoding': 'gzip'})
+
+        assert 'Content-Encoding' not in plain.headers
+        assert 'Accept-Encoding' in plain.headers['Vary']
+        assert plain.headers['ETag'] != gzipped.headers['ETag']
+
+    @patch('app.load_cache')
+    def test_warm_cache_prebuilds_payload(self, mock_load_cache, sample_processed_data):
+        """Test warm_cache serializes cached data ahead of the first request"""
+        import app as app_module
+        mock_load_cache.return_value = {
+            'raw_data': {'raw': 'data'},
+            'processed_data': sample_processed_data
+        }
+
+        app_module.warm_cache()
+
+        source, body, etag, gzipped = app_module._payload
+        assert source is sample_processed_data
+        assert json.loads(body) == sample_processed_data
+        assert gzip.decompress(gzipped) == body
+
+    @patch('app.serialized_payload')
+    @patch('app.load_cache')
+    def test_warm_cache_without_cache(self, mock_load_cache, mock_serialize):
+        """Test warm_cache does nothing when there is no cached data"""
+        import app as app_module
+        mock_load_cache.return_value = None
+
+        app_module.warm_cache()
+
+        mock_serialize.assert_not_called()
@@ -1,7 +1,10 @@
 import pytest
 import json
 import os
+import pickle
+import zstandard
 import tempfile
+import time
 from datetime import datetime, timedelta
 from unittest.mock import patch, mock_open
 import cache_manager
@@ -17,6 +20,14 @@ class TestCacheManager:
             "timestamp": datetime.now().isoformat(),
             "data": self.test_data
         }
+        cache_manager._memory_cache.clear()
+
+    def _write_cache(self, path, cache):
+        """Write a cache file in the on-disk format"""
+        payload = zstandard.ZstdCompressor().compress(pickle.dumps(cache, protocol=5))
+        with open(path, 'wb') as f:
+            f.write(payload)
+        return str(path)
 
     @patch('cache_manager.os.path.exists')
     def test_load_cache_file_not_exists(self, mock_exists):
@@ -25,72 +36,179 @@ class TestCacheManager:
         result = cache_manager.load_cache()
         assert result is None
 
-    @patch('cache_manager.os.path.exists')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_load_cache_expired(self, mock_file, mock_exists):
+    def test_load_cache_expired(self, tmp_path):
         """Test load_cache when cache is expired"""
-        mock_exists.return_value = True
-        
         # Create expired cache (2 days old)
         expired_time = datetime.now() - timedelta(days=2)
         expired_cache = {
             "timestamp": expired_time.isoformat(),
             "data": self.test_data
         }
-        mock_file.return_value.read.return_value = json.dumps(expired_cache)
-        
-        result = cache_manager.load_cache()
+        cache_file = self._write_cache(tmp_path / 'data_cache.pkl', expired_cache)
+
+        with patch('cache_manager.CACHE_FILE', cache_file):
+            result = cache_manager.load_cache()
         assert result is None
 
-    @patch('cache_manager.os.path.exists')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_load_cache_valid(self, mock_file, mock_exists):
+    def test_load_cache_valid(self, tmp_path):
         """Test load_cache with valid, non-expired cache"""
-        mock_exists.return_value = True
-        mock_file.return_value.read.return_value = json.dumps(self.test_cache)
-        
-        result = cache_manager.load_cache()
+        cache_file = self._write_cache(tmp_path / 'data_cache.pkl', self.test_cache)
+
+        with patch('cache_manager.CACHE_FILE', cache_file):
+            result = cache_manager.load_cache()
         assert result == self.test_data
 
-    @patch('cache_manager.os.path.exists')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_load_cache_ticker_type(self, mock_file, mock_exists):
+    def test_load_cache_epoch_timestamp(self, tmp_path):
+        """Test load_cache with caches stamped with an epoch 'ts'"""
+        fresh = self._write_cache(tmp_path / 'fresh.pkl', {'ts': time.time(), 'data': self.test_data})
+        stale = self._write_cache(tmp_path / 'stale.pkl', {'ts': time.time() - 2 * 86400, 'data': self.test_data})
+
+        with patch('cache_manager.CACHE_FILE', fresh):
+            assert cache_manager.load_cache() == self.test_data
+        with patch('cache_manager.CACHE_FILE', stale):
+            assert cache_manager.load_cache() is None
+
+    def test_load_cache_ticker_type(self, tmp_path):
         """Test load_cache with ticker cache type"""
-        mock_exists.return_value = True
-        mock_file.return_value.read.return_value = json.dumps(self.test_cache)
-        
-        result = cache_manager.load_cache('ticker')
+        cache_file = self._write_cache(tmp_path / 'ticker_cache.pkl', self.test_cache)
+
+        with patch('cache_manager.TICKER_CACHE_FILE', cache_file):
+            result = cache_manager.load_cache('ticker')
         assert result == self.test_data
 
-    @patch('cache_manager.os.path.exists')
-    @patch('builtins.open', new_callable=mock_open)
-    def test_load_cache_invalid_json(self, mock_file, mock_exists):
+    def test_raw_cache_round_trip(self, tmp_path):
+        """Test the raw snapshot cache is stored apart from the data cache"""
+        data_file = tmp_path / 'data_cache.pkl'
+        raw_file = tmp_path / 'raw_cache.pkl'
+
+        with patch('cache_manager.CACHE_FILE', str(data_file)), \
+                patch('cache_manager.RAW_CACHE_FILE', str(raw_file)), \
+                patch('cache_manager.LEGACY_CACHE_FILE', str(tmp_path / 'data_cache.json')):
+            cache_manager.save_cache(self.test_data, 'raw')
+            assert cache_manager.load_cache('raw') == self.test_data
+            assert cache_manager.load_cache() is None
+
+    def test_load_cache_invalid_json(self, tmp_path):
         """Test load_cache with invalid JSON"""
-        mock_exists.return_value = True
-        mock_file.return_value.read.return_value = "invalid json"
-        
-        result = cache_manager.load_cache()
+        cache_file = tmp_path / 'data_cache.pkl'
+        cache_file.write_text("invalid json")
+
+        with patch('cache_manager.CACHE_FILE', str(cache_file)):
+            result = cache_manager.load_cache()
         assert result is None
 
+    def test_load_cache_legacy_json_content(self, tmp_path):
+        """Test load_cache still reads a JSON-formatted cache file"""
+        cache_file = tmp_path / 'data_cache.pkl'
+        cache_file.write_text(json.dumps(self.test_cache))
+
+        with patch('cache_manager.CACHE_FILE', str(cache_file)):
+            result = cache_manager.load_cache()
+        assert result == self.test_data
+
+    def test_load_cache_falls_back_to_legacy_file(self, tmp_path):
+        """Test load_cache reads the legacy JSON file when no pickle cache exists"""
+        legacy_file = tmp_path / 'ticker_cache.json'
+        legacy_file.write_text(json.dumps(self.test_cache))
+
+        with patch('cache_manager.TICKER_CACHE_FILE', str(tmp_path / 'ticker_cache.pkl')), \
+                patch('cache_manager.LEGACY_TICKER_CACHE_FILE', str(legacy_file)):
+            result = cache_manager.load_cache('ticker')
+        assert result == self.test_data
+
+    def test_load_cache_uncompressed_pickle(self, tmp_path):
+        """Test load_cache reads a pickle cache written without compression"""
+        cache_file = tmp_path / 'data_cache.pkl'
+        cache_file.write_bytes(pickle.dumps(self.test_cache, protocol=5))
+
+        with patch('cache_manager.CACHE_FILE', str(cache_file)):
+            result = cache_manager.load_cache()
+        assert result == self.test_data
+
+    def test_save_cache_round_trip(self, tmp_path):
+        """Test save_cache writes a compressed file that load_cache reads back"""
+        cache_file = tmp_path / 'data_cache.pkl'
+
+        with patch('cache_manager.CACHE_FILE', str(cache_file)):
+            cache_manager.save_cache(self.test_data)
+            result = cache_manager.load_cache()
+
+        assert cache_file.read_bytes()[:4] == cache_manager.ZSTD_MAGIC
+        assert result == self.test_data
+
+    def test_load_cache_reuses_parsed_data(self, tmp_path):
+        """Test load_cache serves unchanged files from memory"""
+        cache_file = self._write_cache(tmp_path / 'data_cache.pkl', self.test_cache)
+
+        with patch('cache_manager.CACHE_FILE', cache_file):
+            first = cache_manager.load_cache()
+            with patch('builtins.open', side_effect=AssertionError("cache file re-read")):
+                second = cache_manager.load_cache()
+        assert second is first
+
+    def test_cache_timestamp_tracks_last_load(self, tmp_path):
+        """Test cache_timestamp reports the loaded file's stamp until it is replaced"""
+        cache_file = self._write_cache(tmp_path / 'data_cache.pkl', {'ts': 1234.5, 'data': self.test_data})
+
+        with patch('cache_manager.CACHE_FILE', cache_file), \
+                patch('cache_manager.CACHE_DURATIONS', {'data': timedelta(days=365 * 1000)}):
+            assert cache_manager.cache_timestamp() is None
+            cache_manager.load_cache()
+            assert cache_manager.cache_timestamp() == 1234.5
+            cache_manager.save_cache(self.test_data)
+            assert cache_manager.cache_timestamp() is None
+
+    def test_save_cache_invalidates_memory(self, tmp_path):
+        """Test save_cache drops the in-memory copy of the file"""
+        cache_file = self._write_cache(tmp_path / 'data_cache.pkl', self.test_cache)
+
+        with patch('cache_manager.CACHE_FILE', cache_file):
+            assert cache_manager.load_cache() == self.test_data
+            cache_manager.save_cache({"fresh": "data"})
+            assert cache_manager.load_cache() == {"fresh": "data"}
+
+    @patch('cache_manager.os.replace')
+    @patch('cache_manager.os.fsync')
     @patch('builtins.open', new_callable=mock_open)
-    def test_save_cache_success(self, mock_file):
+    def test_save_cache_success(self, mock_file, mock_fsync, mock_replace):
         """Test successful cache save"""
         cache_manager.save_cache(self.test_data)
         
-        # Verify file was opened for writing
-        mock_file.assert_called_once_with('data_cache.json', 'w')
+        # Verify a temporary file was opened for writing
+        tmp_file = f"data_cache.pkl.{os.getpid()}.tmp"
+        mock_file.assert_called_once_with(tmp_file, 'wb')
         
-        # Verify json.dump was called with correct structure
+        # Verify the serialized cache was written
         written_data = mock_file.return_value.__enter__.return_value.write.call_args_list
         assert len(written_data) > 0
 
+        # Verify it was moved into place
+        mock_fsync.assert_called_once()
+        mock_replace.assert_called_once_with(tmp_file, 'data_cache.pkl')
+
+    @patch('cache_manager.os.replace')
+    @patch('cache_manager.os.fsync')
     @patch('builtins.open', new_callable=mock_open)
-    def test_save_cache_ticker_type(self, mock_file):
+    def test_save_cache_ticker_type(self, mock_file, mock_fsync, mock_replace):
         """Test cache save with ticker type"""
         cache_manager.save_cache(self.test_data, 'ticker')
         
         # Verify correct file was used
-        mock_file.assert_called_once_with('ticker_cache.json', 'w')
+        tmp_file = f"ticker_cache.pkl.{os.getpid()}.tmp"
+        mock_file.assert_called_once_with(tmp_file, 'wb')
+        mock_replace.assert_called_once_with(tmp_file, 'ticker_cache.pkl')
+
+    def test_save_cache_failure_keeps_previous_file(self, tmp_path):
+        """Test a failed save leaves the previous cache intact and no temp file"""
+        cache_file = self._write_cache(tmp_path / 'data_cache.pkl', self.test_cache)
+
+        with patch('cache_manager.CACHE_FILE', cache_file), \
+                patch('cache_manager.os.fsync', side_effect=OSError("No space left on device")):
+            cache_manager.save_cache({"new": "data"})
+            result = cache_manager.load_cache()
+
+        assert result == self.test_data
+        assert os.listdir(tmp_path) == ['data_cache.pkl']
 
     @patch('builtins.open', side_effect=IOError("Permission denied"))
     def test_save_cache_error(self, mock_file):
@@ -105,5 +223,17 @@ class TestCacheManager:
 
     def test_cache_file_constants(self):
         """Test cache file constants"""
-        assert cache_manager.CACHE_FILE == 'data_cache.json'
-        assert cache_manager.TICKER_CACHE_FILE == 'ticker_cache.json'
+        assert cache_manager.CACHE_FILE == 'data_cache.pkl'
+        assert cache_manager.TICKER_CACHE_FILE == 'ticker_cache.pkl'
+        assert cache_manager.RAW_CACHE_FILE == 'raw_cache.pkl'
+        assert cache_manager.LEGACY_CACHE_FILE == 'data_cache.json'
+        assert cache_manager.LEGACY_TICKER_CACHE_FILE == 'ticker_cache.json'
+
+    def test_load_cache_empty_file(self, tmp_path):
+        """Test load_cache with an empty cache file"""
+        cache_file = tmp_path / 'data_cache.pkl'
+        cache_file.write_bytes(b'')
+
+        with patch('cache_manager.CACHE_FILE', str(cache_file)):
+            result = cache_manager.load_cache()
+        assert result is None
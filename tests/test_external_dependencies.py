@@ -11,12 +11,7 @@ import cache_manager
 class TestExternalDependencies:
     """Test suite for external dependencies and environment handling"""
 
-    def setup_method(self):
-        """Setup for each test method"""
-        # Clear ticker cache
-        utils.ticker_cache = {}
-
-    def test_environment_variable_loading(self):
+    def test_environment_variable_loading(self, completion_responses):
         """Test that environment variables are loaded correctly"""
         with patch.dict(os.environ, {'PERPLEXITY_API_KEY': 'test-key-123'}):
             # Reload the module to pick up new env var
@@ -24,11 +19,8 @@ class TestExternalDependencies:
             importlib.reload(utils)
             
             # Test that the API key is used in requests
-            with patch('requests.post') as mock_post:
-                mock_response = Mock()
-                mock_response.json.return_value = {'choices': [{'message': {'content': 'AAPL'}}]}
-                mock_response.raise_for_status.return_value = None
-                mock_post.return_value = mock_response
+            with patch('utils._session.post') as mock_post:
+                mock_post.return_value = completion_responses['aapl']
                 
                 utils.search_with_perplexity("test query")
                 
@@ -37,18 +29,15 @@ class TestExternalDependencies:
                 headers = call_args[1]['headers']
                 assert headers['Authorization'] == 'Bearer test-key-123'
 
-    def test_missing_perplexity_api_key(self):
+    def test_missing_perplexity_api_key(self, completion_responses):
         """Test behavior when Perplexity API key is missing"""
         with patch.dict(os.environ, {}, clear=True):
             # Remove the key if it exists
             if 'PERPLEXITY_API_KEY' in os.environ:
                 del os.environ['PERPLEXITY_API_KEY']
             
-            with patch('requests.post') as mock_post:
-                mock_response = Mock()
-                mock_response.json.return_value = {'choices': [{'message': {'content': 'AAPL'}}]}
-                mock_response.raise_for_status.return_value = None
-                mock_post.return_value = mock_response
+            with patch('utils._session.post') as mock_post:
+                mock_post.return_value = completion_responses['aapl']
                 
                 utils.search_with_perplexity("test query")
                 
@@ -82,7 +71,7 @@ class TestExternalDependencies:
 
     def test_network_timeout_handling(self):
         """Test handling of network timeouts"""
-        with patch('requests.post') as mock_post:
+        with patch('utils._session.post') as mock_post:
             mock_post.side_effect = requests.exceptions.Timeout("Request timed out")
             
             result = utils.search_with_perplexity("test query")
@@ -90,7 +79,7 @@ class TestExternalDependencies:
 
     def test_network_connection_error(self):
         """Test handling of network connection errors"""
-        with patch('requests.post') as mock_post:
+        with patch('utils._session.post') as mock_post:
             mock_post.side_effect = requests.exceptions.ConnectionError("Connection failed")
             
             result = utils.search_with_perplexity("test query")
@@ -98,7 +87,7 @@ class TestExternalDependencies:
 
     def test_http_error_responses(self):
         """Test handling of HTTP error responses"""
-        with patch('requests.post') as mock_post:
+        with patch('utils._session.post') as mock_post:
             mock_response = Mock()
             mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError("401 Unauthorized")
             mock_post.return_value = mock_response
@@ -108,7 +97,7 @@ class TestExternalDependencies:
 
     def test_malformed_json_response(self):
         """Test handling of malformed JSON responses"""
-        with patch('requests.post') as mock_post:
+        with patch('utils._session.post') as mock_post:
             mock_response = Mock()
             mock_response.json.side_effect = json.JSONDecodeError("Invalid JSON", "", 0)
             mock_response.raise_for_status.return_value = None
@@ -170,7 +159,7 @@ class TestExternalDependencies:
 
     def test_external_api_rate_limiting(self):
         """Test handling of API rate limiting"""
-        with patch('requests.post') as mock_post:
+        with patch('utils._session.post') as mock_post:
             mock_response = Mock()
             mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError("429 Too Many Requests")
             mock_post.return_value = mock_response
@@ -180,8 +169,8 @@ class TestExternalDependencies:
 
     def test_watermelon_api_structure_changes(self):
         """Test handling of changes in external API structure"""
-        with patch('requests.post') as mock_post_snapshot:
-            with patch('requests.get') as mock_get_data:
+        with patch('utils._session.post') as mock_post_snapshot:
+            with patch('utils._session.get') as mock_get_data:
                 # Mock response with missing dataSnapshot field
                 mock_post_response = Mock()
                 mock_post_response.json.return_value = {'unexpectedField': 'value'}
@@ -193,8 +182,8 @@ class TestExternalDependencies:
 
     def test_base64_decoding_errors(self):
         """Test handling of base64 decoding errors"""
-        with patch('requests.post') as mock_post:
-            with patch('requests.get') as mock_get:
+        with patch('utils._session.post') as mock_post:
+            with patch('utils._session.get') as mock_get:
                 # Mock successful initial request
                 mock_post_response = Mock()
                 mock_post_response.json.return_value = {'dataSnapshot': 'http://test.com/data'}
@@ -203,7 +192,7 @@ class TestExternalDependencies:
                 
                 # Mock response with invalid base64
                 mock_get_response = Mock()
-                mock_get_response.text = "invalid-base64-content!"
+                mock_get_response.content = b"invalid-base64-content!"
                 mock_get_response.raise_for_status.return_value = None
                 mock_get.return_value = mock_get_response
                 
@@ -214,8 +203,8 @@ class TestExternalDependencies:
         """Test handling of JSON parsing errors in decoded data"""
         import base64
         
-        with patch('requests.post') as mock_post:
-            with patch('requests.get') as mock_get:
+        with patch('utils._session.post') as mock_post:
+            with patch('utils._session.get') as mock_get:
                 # Mock successful initial request
                 mock_post_response = Mock()
                 mock_post_response.json.return_value = {'dataSnapshot': 'http://test.com/data'}
@@ -226,7 +215,7 @@ class TestExternalDependencies:
                 invalid_json = "invalid json content"
                 encoded_invalid = base64.b64encode(invalid_json.encode()).decode()
                 mock_get_response = Mock()
-                mock_get_response.text = encoded_invalid
+                mock_get_response.content = encoded_invalid.encode()
                 mock_get_response.raise_for_status.return_value = None
                 mock_get.return_value = mock_get_response
                 
@@ -254,3 +243,36 @@ class TestExternalDependencies:
                 assert result is None  # Should be expired
         finally:
             os.unlink(cache_file)
+
+    def test_concurrent_save_and_load_never_torn(self):
+        """Test readers never observe a partially written cache file"""
+        import threading
+
+        payload = {'rows': [{'company': f'Company {i}', 'sector': 'Technology'} for i in range(2000)]}
+        errors = []
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_file = os.path.join(temp_dir, 'data_cache.pkl')
+
+            def writer():
+                for _ in range(10):
+                    cache_manager.save_cache(payload)
+
+            def reader():
+                for _ in range(10):
+                    result = cache_manager.load_cache()
+                    if result is not None and result != payload:
+                        errors.append(result)
+
+            with patch('cache_manager.CACHE_FILE', cache_file), \
+                    patch('cache_manager.logger') as mock_logger:
+                cache_manager.save_cache(payload)
+                threads = [threading.Thread(target=writer) for _ in range(3)]
+                threads += [threading.Thread(target=reader) for _ in range(3)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+
+            assert errors == []
+            mock_logger.error.assert_not_called()
@@ -5,75 +5,76 @@ import requests
 import utils
 
 
+GLIDE_SNAPSHOT_URL = (
+    'https://watermelonindex.glide.page/api/container/playerFunctionCritical/'
+    'getAppSnapshot?reqid=cRtoCkoYLvPuumH1tQ03'
+)
+
 class TestUtils:
     """Test suite for utils module"""
 
-    def setup_method(self):
-        """Setup for each test method"""
-        self.sample_company_data = {
-            'Sheet1': [
-                {
-                    'data': {
-                        'Company Name': 'Test Company',
-                        'Company name': 'test-company',
-                        'Sector': 'Technology',
-                        'Complicity details': 'Test details',
-                        'Record last updated': {'repr': '2023-01-01'},
-                        'Source': 'Source 1',
-                        'Second source': 'Source 2',
-                        'Military': 'Yes'
-                    }
+    # Read-only; shared by every test instead of rebuilt per test
+    sample_company_data = {
+        'Sheet1': [
+            {
+                'data': {
+                    'Company Name': 'Test Company',
+                    'Company name': 'test-company',
+                    'Sector': 'Technology',
+                    'Complicity details': 'Test details',
+                    'Record last updated': {'repr': '2023-01-01'},
+                    'Source': 'Source 1',
+                    'Second source': 'Source 2',
+                    'Military': 'Yes'
                 }
-            ],
-            'Campaigns': [
-                {
-                    'id': 'campaign-1',
-                    'data': {
-                        'Campaign Name': 'Test Campaign',
-                        'Companies': 'test-company',
-                        'Description': 'Test campaign description',
-                        'Location': 'Test Location'
-                    }
+            }
+        ],
+        'Campaigns': [
+            {
+                'id': 'campaign-1',
+                'data': {
+                    'Campaign Name': 'Test Campaign',
+                    'Companies': 'test-company',
+                    'Description': 'Test campaign description',
+                    'Location': 'Test Location'
                 }
-            ]
-        }
-
-    def test_is_valid_ticker_valid_cases(self):
-        """Test is_valid_ticker with valid ticker formats"""
-        valid_tickers = [
-            'AAPL',      # Regular NYSE/NASDAQ
-            'GOOGL',     # Regular NYSE/NASDAQ
-            'ABBNY',     # ADR ticker
-            'ADDYY',     # ADR ending in Y
-            'EADSY',     # Foreign ordinary shares
-            'BAESY',     # ADR format
-            'A',         # Single letter
-            'ABCDE'      # 5 letters
+            }
         ]
-        
-        for ticker in valid_tickers:
-            assert utils.is_valid_ticker(ticker), f"Ticker {ticker} should be valid"
-
-    def test_is_valid_ticker_invalid_cases(self):
+    }
+
+    @pytest.mark.parametrize("ticker", [
+        'AAPL',      # Regular NYSE/NASDAQ
+        'GOOGL',     # Regular NYSE/NASDAQ
+        'ABBNY',     # ADR ticker
+        'ADDYY',     # ADR ending in Y
+        'EADSY',     # Foreign ordinary shares
+        'BAESY',     # ADR format
+        'A',         # Single letter
+        'ABCDE'      # 5 letters
+    ])
+    def test_is_valid_ticker_valid_cases(self, ticker):
+        """Test is_valid_ticker with valid ticker formats"""
+        assert utils.is_valid_ticker(ticker), f"Ticker {ticker} should be valid"
+
+    @pytest.mark.parametrize("ticker", [
+        '',           # Empty string
+        None,         # None value
+        '123ABC',     # Starts with numbers
+        'ABCDEFGHIJK', # Too long
+        'abc',        # Lowercase
+        'AB-CD',      # Contains hyphen
+        'AB CD'       # Contains space
+    ])
+    def test_is_valid_ticker_invalid_cases(self, ticker):
         """Test is_valid_ticker with invalid ticker formats"""
-        invalid_tickers = [
-            '',           # Empty string
-            None,         # None value
-            '123ABC',     # Starts with numbers
-            'ABCDEFGHIJK', # Too long
-            'abc',        # Lowercase
-            'AB-CD',      # Contains hyphen
-            'AB CD'       # Contains space
-        ]
-        
-        for ticker in invalid_tickers:
-            assert not utils.is_valid_ticker(ticker), f"Ticker {ticker} should be invalid"
+        assert not utils.is_valid_ticker(ticker), f"Ticker {ticker} should be invalid"
 
-    @patch('utils.search_with_perplexity')
-    @patch('utils.save_cache')
-    @patch('utils.load_cache')
-    def test_get_stock_ticker_cached(self, mock_load_cache, mock_save_cache, mock_search):
+    def test_get_stock_ticker_cached(self, monkeypatch):
         """Test get_stock_ticker when result is cached"""
+        mock_search = Mock()
+        monkeypatch.setattr(utils, "search_with_perplexity", mock_search)
+        monkeypatch.setattr(utils, "save_cache", lambda *args: None)
+
         # Setup cache to return cached ticker
         utils.ticker_cache = {'Test Company': 'TEST'}
         
@@ -82,157 +83,223 @@ class TestUtils:
         assert result == 'TEST'
         mock_search.assert_not_called()
 
-    @patch('utils.search_with_perplexity')
-    @patch('utils.save_cache')
-    @patch('utils.load_cache')
-    def test_get_stock_ticker_api_success(self, mock_load_cache, mock_save_cache, mock_search):
+    @pytest.mark.parametrize("entry, expected_hit", [
+        ({'ticker': None, 'ts': 0}, False),     # Expired negative
+        (None, False),                          # Legacy negative, no timestamp
+        ('TEST', True),                         # Legacy positive
+        ({'ticker': 'TEST', 'ts': 0}, True),    # Positives outlive the negative TTL
+    ])
+    def test_get_stock_ticker_cache_entry_expiry(self, monkeypatch, entry, expected_hit):
+        """Test negative results expire while found tickers are kept"""
+        mock_search = Mock(return_value=None)
+        monkeypatch.setattr(utils, "search_with_perplexity", mock_search)
+        monkeypatch.setattr(utils.time, "time", lambda: utils.TICKER_NEGATIVE_TTL + 1)
+        utils.ticker_cache = {'Test Company': entry}
+
+        utils.get_stock_ticker('Test Company')
+
+        assert mock_search.called is not expected_hit
+
+    def test_get_stock_ticker_recent_negative_is_cached(self, monkeypatch):
+        """Test a fresh negative result is served without a new search"""
+        mock_search = Mock()
+        monkeypatch.setattr(utils, "search_with_perplexity", mock_search)
+        utils.ticker_cache = {'Private Company': {'ticker': None, 'ts': utils.time.time()}}
+
+        assert utils.get_stock_ticker('Private Company') is None
+        mock_search.assert_not_called()
+
+    @patch('utils._session.post')
+    def test_expired_negative_is_searched_again_on_refresh(self, mock_post, monkeypatch, completion_responses):
+        """Test a refresh after the negative TTL sends a real search instead of a memoized reply"""
+        mock_post.return_value = completion_responses['null']
+        monkeypatch.setattr(utils, "search_tickers_with_perplexity", lambda names: None)
+        monkeypatch.setattr(utils, "fetch_raw_data", lambda: {'data': self.sample_company_data})
+        monkeypatch.setattr(utils, "load_cache", lambda cache_type='data': None)
+        monkeypatch.setattr(utils, "save_cache", Mock())
+
+        utils.fetch_and_decode_data()
+        assert mock_post.call_count == 1
+        assert utils.ticker_cache['Test Company']['ticker'] is None
+
+        now = utils.time.time()
+        monkeypatch.setattr(utils.time, "time", lambda: now + utils.TICKER_NEGATIVE_TTL + 86400)
+        utils.fetch_and_decode_data()
+
+        assert mock_post.call_count == 2
+
+    def test_get_stock_ticker_coalesces_concurrent_lookups(self, monkeypatch, completion_payloads):
+        """Test concurrent calls for one uncached company share a single search"""
+        import threading
+
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        waiting = threading.Semaphore(0)
+        future_result = utils.Future.result
+
+        def counting_result(future, *args, **kwargs):
+            waiting.release()
+            return future_result(future, *args, **kwargs)
+
+        monkeypatch.setattr(utils.Future, "result", counting_result)
+
+        def slow_search(query):
+            calls.append(query)
+            started.set()
+            release.wait(5)
+            return completion_payloads['null']
+
+        monkeypatch.setattr(utils, "search_with_perplexity", slow_search)
+        # Without caching, only coalescing can keep the later callers off the API
+        monkeypatch.setattr(utils, "_cache_ticker", lambda name, ticker: None)
+
+        results = []
+        def lookup():
+            results.append(utils.get_stock_ticker('Slow Company'))
+
+        owner = threading.Thread(target=lookup)
+        owner.start()
+        assert started.wait(5)
+        waiters = [threading.Thread(target=lookup) for _ in range(2)]
+        for thread in waiters:
+            thread.start()
+        # Only release the owner once both waiters are blocked on its Future
+        for _ in waiters:
+            assert waiting.acquire(timeout=5)
+        release.set()
+        for thread in [owner] + waiters:
+            thread.join()
+
+        assert results == [None, None, None]
+        assert len(calls) == 1
+        assert utils._inflight_lookups == {}
+
+    def test_get_stock_ticker_rechecks_cache_before_owning(self, monkeypatch):
+        """Test a lookup cached just after the first check is not repeated"""
+        results = iter([(False, None), (True, 'LATE')])
+        monkeypatch.setattr(utils, "_cached_ticker", lambda name: next(results))
+        mock_lookup = Mock()
+        monkeypatch.setattr(utils, "_lookup_stock_ticker", mock_lookup)
+
+        assert utils.get_stock_ticker('Late Company') == 'LATE'
+        mock_lookup.assert_not_called()
+        assert utils._inflight_lookups == {}
+
+    def test_get_stock_ticker_api_success(self, monkeypatch, completion_payloads):
         """Test get_stock_ticker with successful API response"""
-        utils.ticker_cache = {}
-        
         # Mock successful Perplexity response
-        mock_search.return_value = {
-            'choices': [{'message': {'content': 'AAPL'}}]
-        }
+        monkeypatch.setattr(utils, "search_with_perplexity", lambda query: completion_payloads['aapl'])
+        mock_save_cache = Mock()
+        monkeypatch.setattr(utils, "save_cache", mock_save_cache)
         
         result = utils.get_stock_ticker('Apple Inc.')
         
         assert result == 'AAPL'
-        assert utils.ticker_cache['Apple Inc.'] == 'AAPL'
+        assert utils.ticker_cache['Apple Inc.']['ticker'] == 'AAPL'
+        mock_save_cache.assert_not_called()
+
+        # The lookup is written back on the next flush, and only once
+        utils.flush_ticker_cache()
+        utils.flush_ticker_cache()
         mock_save_cache.assert_called_once()
+        saved, cache_type = mock_save_cache.call_args[0]
+        assert saved['Apple Inc.']['ticker'] == 'AAPL'
+        assert cache_type == utils.TICKER_CACHE_KEY
 
-    @patch('utils.search_with_perplexity')
-    @patch('utils.save_cache')
-    def test_get_stock_ticker_null_response(self, mock_save_cache, mock_search):
+    def test_get_stock_ticker_null_response(self, monkeypatch, completion_payloads):
         """Test get_stock_ticker with null response"""
-        utils.ticker_cache = {}
-        
         # Mock null response
-        mock_search.return_value = {
-            'choices': [{'message': {'content': 'null'}}]
-        }
+        monkeypatch.setattr(utils, "search_with_perplexity", lambda query: completion_payloads['null'])
+        monkeypatch.setattr(utils, "save_cache", lambda *args: None)
         
         result = utils.get_stock_ticker('Private Company')
         
         assert result is None
-        assert utils.ticker_cache['Private Company'] is None
+        assert utils.ticker_cache['Private Company']['ticker'] is None
 
-    @patch('utils.search_with_perplexity')
-    def test_get_stock_ticker_api_error(self, mock_search):
+    def test_get_stock_ticker_api_error(self, monkeypatch):
         """Test get_stock_ticker with API error"""
-        utils.ticker_cache = {}
-        
         # Mock API error
-        mock_search.return_value = None
+        monkeypatch.setattr(utils, "search_with_perplexity", lambda query: None)
         
         result = utils.get_stock_ticker('Test Company')
         
         assert result is None
 
-    @patch('utils.search_with_perplexity')
-    @patch('utils.save_cache')
-    def test_get_stock_ticker_invalid_format(self, mock_save_cache, mock_search):
+    def test_get_stock_ticker_invalid_format(self, monkeypatch, completion_payloads):
         """Test get_stock_ticker with invalid ticker format"""
-        utils.ticker_cache = {}
-
         # Mock response with invalid ticker
-        mock_search.return_value = {
-            'choices': [{'message': {'content': '123INVALID'}}]
-        }
+        monkeypatch.setattr(utils, "search_with_perplexity", lambda query: completion_payloads['invalid'])
+        monkeypatch.setattr(utils, "save_cache", lambda *args: None)
 
         result = utils.get_stock_ticker('Test Company')
 
         assert result is None
-        assert utils.ticker_cache['Test Company'] is None
+        assert utils.ticker_cache['Test Company']['ticker'] is None
 
-    @patch('utils.search_with_perplexity')
-    @patch('utils.save_cache')
-    def test_get_stock_ticker_extracts_from_sentence(self, mock_save_cache, mock_search):
+    def test_get_stock_ticker_extracts_from_sentence(self, monkeypatch, completion_payloads):
         """Test get_stock_ticker extracts ticker from descriptive response"""
-        utils.ticker_cache = {}
-
         # Mock response with ticker embedded in sentence
-        mock_search.return_value = {
-            'choices': [{'message': {'content': 'The stock ticker symbol for ABB Group in the US OTC market is ABBNY.'}}]
-        }
+        monkeypatch.setattr(utils, "search_with_perplexity", lambda query: completion_payloads['abb_sentence'])
+        monkeypatch.setattr(utils, "save_cache", lambda *args: None)
 
         result = utils.get_stock_ticker('ABB Group')
 
         assert result == 'ABBNY'
-        assert utils.ticker_cache['ABB Group'] == 'ABBNY'
+        assert utils.ticker_cache['ABB Group']['ticker'] == 'ABBNY'
 
-    @patch('utils.parse_ticker_with_openrouter')
-    @patch('utils.search_with_perplexity')
-    @patch('utils.save_cache')
-    def test_get_stock_ticker_with_openrouter_parsing(self, mock_save_cache, mock_search, mock_openrouter):
+    def test_get_stock_ticker_with_openrouter_parsing(self, monkeypatch, completion_payloads):
         """Test get_stock_ticker uses OpenRouter for parsing"""
-        utils.ticker_cache = {}
-
         # Mock Perplexity response
-        mock_search.return_value = {
-            'choices': [{'message': {'content': 'The stock ticker symbol for Allianz in the US OTC markets is ALIZF.'}}]
-        }
+        monkeypatch.setattr(utils, "search_with_perplexity", lambda query: completion_payloads['allianz_sentence'])
+        monkeypatch.setattr(utils, "save_cache", lambda *args: None)
 
         # Mock OpenRouter parsing
-        mock_openrouter.return_value = 'ALIZF'
+        mock_openrouter = Mock(return_value='ALIZF')
+        monkeypatch.setattr(utils, "parse_ticker_with_openrouter", mock_openrouter)
 
         result = utils.get_stock_ticker('Allianz')
 
         assert result == 'ALIZF'
-        assert utils.ticker_cache['Allianz'] == 'ALIZF'
+        assert utils.ticker_cache['Allianz']['ticker'] == 'ALIZF'
         mock_openrouter.assert_called_once()
 
-    @patch('utils.parse_ticker_with_openrouter')
-    @patch('utils.search_with_perplexity')
-    @patch('utils.save_cache')
-    def test_get_stock_ticker_openrouter_fallback(self, mock_save_cache, mock_search, mock_openrouter):
+    def test_get_stock_ticker_openrouter_fallback(self, monkeypatch, completion_payloads):
         """Test fallback when OpenRouter fails"""
-        utils.ticker_cache = {}
-
         # Mock Perplexity response
-        mock_search.return_value = {
-            'choices': [{'message': {'content': 'AAPL'}}]
-        }
+        monkeypatch.setattr(utils, "search_with_perplexity", lambda query: completion_payloads['aapl'])
+        monkeypatch.setattr(utils, "save_cache", lambda *args: None)
 
         # Mock OpenRouter failure
-        mock_openrouter.return_value = None
+        mock_openrouter = Mock(return_value=None)
+        monkeypatch.setattr(utils, "parse_ticker_with_openrouter", mock_openrouter)
 
         result = utils.get_stock_ticker('Apple')
 
         assert result == 'AAPL'  # Should fallback to first word
         mock_openrouter.assert_called_once()
 
-    @patch('requests.post')
-    def test_parse_ticker_with_openrouter_success(self, mock_post):
+    @patch('utils._session.post')
+    def test_parse_ticker_with_openrouter_success(self, mock_post, completion_responses):
         """Test successful OpenRouter ticker parsing"""
-        # Mock successful response
-        mock_response = Mock()
-        mock_response.json.return_value = {
-            'choices': [{'message': {'content': 'ALIZF'}}]
-        }
-        mock_response.raise_for_status.return_value = None
-        mock_post.return_value = mock_response
+        mock_post.return_value = completion_responses['alizf']
 
         result = utils.parse_ticker_with_openrouter("The stock ticker symbol for Allianz is ALIZF")
 
         assert result == 'ALIZF'
         mock_post.assert_called_once()
 
-    @patch('requests.post')
-    def test_parse_ticker_with_openrouter_null_response(self, mock_post):
+    @patch('utils._session.post')
+    def test_parse_ticker_with_openrouter_null_response(self, mock_post, completion_responses):
         """Test OpenRouter parsing with null response"""
-        # Mock null response
-        mock_response = Mock()
-        mock_response.json.return_value = {
-            'choices': [{'message': {'content': 'null'}}]
-        }
-        mock_response.raise_for_status.return_value = None
-        mock_post.return_value = mock_response
+        mock_post.return_value = completion_responses['null']
 
         result = utils.parse_ticker_with_openrouter("This company is not publicly traded")
 
         assert result is None
 
-    @patch('requests.post')
+    @patch('utils._session.post')
     def test_parse_ticker_with_openrouter_error(self, mock_post):
         """Test OpenRouter parsing with API error"""
         # Mock API error
@@ -242,21 +309,54 @@ class TestUtils:
 
         assert result is None
 
-    @patch('requests.post')
-    def test_search_with_perplexity_success(self, mock_post):
+    @patch('utils._session.post')
+    def test_parse_ticker_with_openrouter_memoizes_by_content(self, mock_post, completion_responses):
+        """Test the same Perplexity reply is only parsed once"""
+        mock_post.return_value = completion_responses['alizf']
+
+        first = utils.parse_ticker_with_openrouter("Allianz trades OTC as ALIZF")
+        second = utils.parse_ticker_with_openrouter("Allianz trades OTC as ALIZF")
+
+        assert first == second == 'ALIZF'
+        mock_post.assert_called_once()
+
+    @patch('utils._session.post')
+    def test_search_with_perplexity_success(self, mock_post, completion_payloads, completion_responses):
         """Test successful Perplexity API call"""
-        # Mock successful response
-        mock_response = Mock()
-        mock_response.json.return_value = {'choices': [{'message': {'content': 'AAPL'}}]}
-        mock_response.raise_for_status.return_value = None
-        mock_post.return_value = mock_response
+        mock_post.return_value = completion_responses['aapl']
         
         result = utils.search_with_perplexity('Test query')
         
-        assert result == {'choices': [{'message': {'content': 'AAPL'}}]}
+        assert result == completion_payloads['aapl']
         mock_post.assert_called_once()
 
-    @patch('requests.post')
+    @patch('utils._session.post')
+    def test_search_with_perplexity_requests_low_search_context(self, mock_post, completion_responses):
+        """Test Perplexity is asked for a small search context"""
+        mock_post.return_value = completion_responses['aapl']
+
+        utils.search_with_perplexity('Test query')
+
+        payload = mock_post.call_args.kwargs['json']
+        assert payload['web_search_options'] == {'search_context_size': 'low'}
+
+    def test_session_does_not_retry_posts(self):
+        """Test paid LLM POSTs are never re-sent by the transport"""
+        retry = utils._session.get_adapter('https://api.perplexity.ai').max_retries
+
+        assert retry.is_retry('GET', 503)
+        assert not retry.is_retry('POST', 503)
+
+    @patch('utils._session.post')
+    def test_search_with_perplexity_sets_timeout(self, mock_post, completion_responses):
+        """Test Perplexity calls never wait on an unbounded read"""
+        mock_post.return_value = completion_responses['aapl']
+
+        utils.search_with_perplexity('Test query')
+
+        assert mock_post.call_args.kwargs['timeout'] == utils.HTTP_TIMEOUT
+
+    @patch('utils._session.post')
     def test_search_with_perplexity_error(self, mock_post):
         """Test Perplexity API call with error"""
         # Mock request exception
@@ -266,10 +366,30 @@ class TestUtils:
         
         assert result is None
 
-    @patch('utils.get_stock_ticker')
-    def test_flatten_and_standardize(self, mock_get_ticker):
+    @patch('utils._session.post')
+    def test_search_with_perplexity_memoizes_success(self, mock_post, completion_payloads, completion_responses):
+        """Test repeated queries reuse a successful Perplexity response"""
+        mock_post.return_value = completion_responses['aapl']
+
+        first = utils.search_with_perplexity('Test query')
+        second = utils.search_with_perplexity('Test query')
+
+        assert first == second == completion_payloads['aapl']
+        mock_post.assert_called_once()
+
+    @patch('utils._session.post')
+    def test_search_with_perplexity_does_not_memoize_errors(self, mock_post, completion_payloads, completion_responses):
+        """Test failed Perplexity calls are retried on the next query"""
+        mock_post.side_effect = [requests.exceptions.RequestException("API Error"), completion_responses['aapl']]
+
+        assert utils.search_with_perplexity('Test query') is None
+        assert utils.search_with_perplexity('Test query') == completion_payloads['aapl']
+        assert mock_post.call_count == 2
+
+    @patch('utils.get_stock_tickers')
+    def test_flatten_and_standardize(self, mock_get_tickers):
         """Test flatten_and_standardize function"""
-        mock_get_ticker.return_value = 'TEST'
+        mock_get_tickers.side_effect = lambda names: dict.fromkeys(names, 'TEST')
 
         result = utils.flatten_and_standardize(self.sample_company_data)
 
@@ -290,9 +410,178 @@ class TestUtils:
         assert company['campaignId'] == 'campaign-1'
 
     @patch('utils.get_stock_ticker')
-    def test_flatten_and_standardize_missing_companies_field(self, mock_get_ticker):
+    @patch('utils.search_tickers_with_perplexity')
+    def test_get_stock_tickers_batches_uncached_names(self, mock_batch_search, mock_get_ticker, monkeypatch,
+                                                     make_completion):
+        """Test uncached names are resolved TICKER_BATCH_SIZE per request"""
+        monkeypatch.setattr(utils, "TICKER_BATCH_SIZE", 2)
+        monkeypatch.setattr(utils, "save_cache", lambda *args: None)
+        mock_batch_search.side_effect = lambda names: make_completion(json.dumps(
+            {'tickers': [{'name': name, 'ticker': name.upper()[:4]} for name in names]}
+        ))
+        utils.ticker_cache = {'Cached': 'CACH'}
+
+        result = utils.get_stock_tickers(['Alpha', 'Cached', 'Beta', 'Gamma', 'Alpha', 'Delta', 'Omega'])
+
+        assert result == {
+            'Alpha': 'ALPH', 'Cached': 'CACH', 'Beta': 'BETA',
+            'Gamma': 'GAMM', 'Delta': 'DELT', 'Omega': 'OMEG'
+        }
+        assert sorted(call.args[0] for call in mock_batch_search.call_args_list) == [
+            ['Alpha', 'Beta'], ['Gamma', 'Delta'], ['Omega']
+        ]
+        assert utils.ticker_cache['Gamma']['ticker'] == 'GAMM'
+        mock_get_ticker.assert_not_called()
+
+    @patch('utils.get_stock_ticker')
+    @patch('utils.search_tickers_with_perplexity')
+    def test_get_stock_tickers_falls_back_per_name(self, mock_batch_search, mock_get_ticker, monkeypatch,
+                                                  make_completion):
+        """Test names a batch reply leaves out or garbles are looked up individually"""
+        monkeypatch.setattr(utils, "save_cache", lambda *args: None)
+        mock_batch_search.return_value = make_completion('```json\n' + json.dumps({'tickers': [
+            {'name': 'Alpha', 'ticker': 'ALPH'},
+            {'name': 'Beta', 'ticker': None},
+            {'name': 'Gamma', 'ticker': 'not a ticker'},
+            {'name': 'Unasked', 'ticker': 'UNAS'}
+        ]}) + '\n```')
+        mock_get_ticker.side_effect = lambda name: name.upper()[:4]
+
+        result = utils.get_stock_tickers(['Alpha', 'Beta', 'Gamma', 'Delta'])
+
+        assert result == {'Alpha': 'ALPH', 'Beta': None, 'Gamma': 'GAMM', 'Delta': 'DELT'}
+        assert utils.ticker_cache['Beta']['ticker'] is None
+        assert 'Unasked' not in utils.ticker_cache
+        assert [call.args[0] for call in mock_get_ticker.call_args_list] == ['Gamma', 'Delta']
+
+    @patch('utils._perplexity_request')
+    def test_search_tickers_uses_fixed_schema(self, mock_request):
+        """Test every batch sends the same reply schema, free of company names"""
+        utils.search_tickers_with_perplexity(['Alpha "A"', 'Beta'])
+        utils.search_tickers_with_perplexity(['Gamma'])
+
+        schemas = [call.kwargs['response_format']['json_schema']['schema']
+                   for call in mock_request.call_args_list]
+        assert schemas == [utils._TICKER_BATCH_SCHEMA, utils._TICKER_BATCH_SCHEMA]
+        assert 'Alpha' not in json.dumps(schemas)
+
+    @patch('utils.get_stock_ticker')
+    @patch('utils.search_tickers_with_perplexity')
+    def test_get_stock_tickers_batch_failure_falls_back(self, mock_batch_search, mock_get_ticker):
+        """Test a failed batch request falls back to single lookups"""
+        mock_batch_search.return_value = None
+        mock_get_ticker.return_value = None
+
+        result = utils.get_stock_tickers(['Alpha', 'Beta'])
+
+        assert result == {'Alpha': None, 'Beta': None}
+        assert mock_get_ticker.call_count == 2
+
+    @patch('utils.get_stock_tickers')
+    def test_flatten_and_standardize_looks_up_duplicate_names_once(self, mock_get_tickers):
+        """Test a company listed twice costs a single ticker lookup"""
+        mock_get_tickers.side_effect = lambda names: dict.fromkeys(names, 'TEST')
+
+        rows = [
+            {
+                'data': {
+                    'Company Name': 'Test Company',
+                    'Company name': f'test-company-{i}',
+                    'Sector': 'Technology',
+                    'Complicity details': 'Details',
+                    'Record last updated': {'repr': '2023-01-01'}
+                }
+            }
+            for i in range(2)
+        ]
+
+        result = utils.flatten_and_standardize({'Sheet1': rows, 'Campaigns': []})
+
+        assert [c['stockTicker'] for c in result] == ['TEST', 'TEST']
+        mock_get_tickers.assert_called_once_with(['Test Company'])
+
+    @patch('utils.get_stock_tickers')
+    def test_flatten_and_standardize_links_campaign_to_listed_companies(self, mock_get_tickers):
+        """Test a campaign naming several ids reaches each matching company"""
+        mock_get_tickers.side_effect = lambda names: dict.fromkeys(names, None)
+
+        rows = [
+            {
+                'data': {
+                    'Company Name': name,
+                    'Company name': name.lower(),
+                    'Sector': 'Technology',
+                    'Complicity details': 'Details',
+                    'Record last updated': {'repr': '2023-01-01'}
+                }
+            }
+            for name in ['Alpha', 'Beta', 'Gamma']
+        ]
+        campaigns = [{
+            'id': 'campaign-1',
+            'data': {'Campaign Name': 'Test Campaign', 'Companies': 'alpha, unknown ,gamma'}
+        }]
+
+        result = utils.flatten_and_standardize({'Sheet1': rows, 'Campaigns': campaigns})
+
+        assert [c.get('campaignId') for c in result] == ['campaign-1', None, 'campaign-1']
+
+    @patch('utils.save_cache')
+    @patch('utils.search_with_perplexity')
+    @patch('utils.search_tickers_with_perplexity')
+    def test_flatten_and_standardize_flushes_ticker_cache_once(self, mock_batch_search, mock_search,
+                                                             mock_save_cache, completion_payloads, monkeypatch):
+        """Test a refresh writes the ticker cache once for all new lookups"""
+        # Batch request fails, so every name takes the single-lookup path
+        mock_batch_search.return_value = None
+        mock_search.return_value = completion_payloads['aapl']
+        monkeypatch.setattr(utils, "parse_ticker_with_openrouter", lambda content: None)
+
+        rows = [
+            {
+                'data': {
+                    'Company Name': name,
+                    'Company name': name.lower(),
+                    'Sector': 'Technology',
+                    'Complicity details': 'Details',
+                    'Record last updated': {'repr': '2023-01-01'}
+                }
+            }
+            for name in ['Alpha', 'Beta', 'Gamma']
+        ]
+
+        utils.flatten_and_standardize({'Sheet1': rows, 'Campaigns': []})
+
+        mock_save_cache.assert_called_once()
+        assert set(mock_save_cache.call_args[0][0]) == {'Alpha', 'Beta', 'Gamma'}
+
+    @patch('utils.get_stock_tickers')
+    def test_flatten_and_standardize_interns_labels(self, mock_get_tickers):
+        """Test repeated sector and category labels share one string object"""
+        mock_get_tickers.side_effect = lambda names: dict.fromkeys(names, None)
+
+        rows = []
+        for i in range(2):
+            rows.append({
+                'data': {
+                    'Company Name': f'Company {i}',
+                    'Company name': f'company-{i}',
+                    'Sector': ''.join(['Tech', 'nology']),
+                    'Complicity details': 'Details',
+                    'Record last updated': {'repr': '2023-01-01'},
+                    'Military': ''.join(['Dir', 'ect'])
+                }
+            })
+
+        result = utils.flatten_and_standardize({'Sheet1': rows, 'Campaigns': []})
+
+        assert result[0]['sector'] is result[1]['sector']
+        assert result[0]['military'] is result[1]['military']
+
+    @patch('utils.get_stock_tickers')
+    def test_flatten_and_standardize_missing_companies_field(self, mock_get_tickers):
         """Test flatten_and_standardize handles missing 'Companies' field gracefully"""
-        mock_get_ticker.return_value = 'TEST'
+        mock_get_tickers.side_effect = lambda names: dict.fromkeys(names, 'TEST')
 
         # Data with campaign missing 'Companies' field
         test_data = {
@@ -329,10 +618,10 @@ class TestUtils:
         # Campaign data should not be merged since no Companies field
         assert 'campaignName' not in company
 
-    @patch('utils.get_stock_ticker')
-    def test_flatten_and_standardize_empty_companies_field(self, mock_get_ticker):
+    @patch('utils.get_stock_tickers')
+    def test_flatten_and_standardize_empty_companies_field(self, mock_get_tickers):
         """Test flatten_and_standardize handles empty 'Companies' field gracefully"""
-        mock_get_ticker.return_value = 'TEST'
+        mock_get_tickers.side_effect = lambda names: dict.fromkeys(names, 'TEST')
 
         # Data with campaign having empty 'Companies' field
         test_data = {
@@ -369,38 +658,26 @@ class TestUtils:
         # Campaign data should not be merged since Companies field is empty
         assert 'campaignName' not in company
 
-    @patch('requests.post')
-    @patch('requests.get')
-    def test_fetch_raw_data_success(self, mock_get, mock_post):
+    def test_fetch_raw_data_success(self, http_stub):
         """Test successful fetch_raw_data"""
         # Mock initial POST response
-        mock_post_response = Mock()
-        mock_post_response.json.return_value = {'dataSnapshot': 'http://test.com/snapshot'}
-        mock_post_response.raise_for_status.return_value = None
-        mock_post.return_value = mock_post_response
+        http_stub[("POST", GLIDE_SNAPSHOT_URL)] = {'dataSnapshot': 'http://test.com/snapshot'}
         
         # Mock snapshot GET response
         test_data = {'test': 'data'}
         encoded_data = json.dumps(test_data).encode()
         import base64
-        encoded_b64 = base64.b64encode(encoded_data).decode()
+        encoded_b64 = base64.b64encode(encoded_data)
         
-        mock_get_response = Mock()
-        mock_get_response.text = encoded_b64
-        mock_get_response.raise_for_status.return_value = None
-        mock_get.return_value = mock_get_response
+        http_stub[("GET", 'http://test.com/snapshot')] = encoded_b64
         
         result = utils.fetch_raw_data()
         
         assert result == test_data
 
-    @patch('requests.post')
-    def test_fetch_raw_data_no_snapshot_url(self, mock_post):
+    def test_fetch_raw_data_no_snapshot_url(self, http_stub):
         """Test fetch_raw_data when dataSnapshot URL is missing"""
-        mock_response = Mock()
-        mock_response.json.return_value = {}  # No dataSnapshot key
-        mock_response.raise_for_status.return_value = None
-        mock_post.return_value = mock_response
+        http_stub[("POST", GLIDE_SNAPSHOT_URL)] = {}  # No dataSnapshot key
         
         with pytest.raises(ValueError, match="dataSnapshot URL not found"):
             utils.fetch_raw_data()
@@ -424,6 +701,53 @@ class TestUtils:
         mock_fetch_raw.assert_not_called()
         mock_flatten.assert_not_called()
 
+    @patch('utils.fetch_raw_data')
+    @patch('utils.load_cache')
+    def test_fetch_and_decode_data_cached_skips_raw(self, mock_load_cache, mock_fetch_raw):
+        """Test the warm path does not load the raw snapshot cache"""
+        mock_load_cache.return_value = {'processed_data': [{'company': 'data'}]}
+
+        result = utils.fetch_and_decode_data()
+
+        assert result == {'processed_data': [{'company': 'data'}]}
+        mock_load_cache.assert_called_once_with()
+        mock_fetch_raw.assert_not_called()
+
+    @patch('utils.fetch_raw_data')
+    @patch('utils.load_cache')
+    def test_fetch_and_decode_data_cached_want_raw(self, mock_load_cache, mock_fetch_raw):
+        """Test want_raw loads the snapshot from its own cache"""
+        caches = {
+            'data': {'refresh': 1.0, 'processed_data': [{'company': 'data'}]},
+            'raw': {'refresh': 1.0, 'snapshot': {'test': 'raw'}}
+        }
+        mock_load_cache.side_effect = lambda cache_type='data': caches[cache_type]
+
+        result = utils.fetch_and_decode_data(want_raw=True)
+
+        assert result == {'raw_data': {'test': 'raw'}, 'processed_data': [{'company': 'data'}]}
+        mock_fetch_raw.assert_not_called()
+
+    @patch('utils.fetch_raw_data')
+    @patch('utils.flatten_and_standardize')
+    @patch('utils.save_cache')
+    @patch('utils.load_cache')
+    def test_fetch_and_decode_data_rejects_snapshot_from_other_refresh(self, mock_load_cache, mock_save_cache,
+                                                                       mock_flatten, mock_fetch_raw):
+        """Test want_raw refetches instead of pairing a stale snapshot with newer data"""
+        caches = {
+            'data': {'refresh': 2.0, 'processed_data': [{'company': 'old'}]},
+            'raw': {'refresh': 1.0, 'snapshot': {'test': 'stale'}}
+        }
+        mock_load_cache.side_effect = lambda cache_type='data': caches[cache_type]
+        mock_fetch_raw.return_value = {'data': self.sample_company_data}
+        mock_flatten.return_value = [{'company': 'new'}]
+
+        result = utils.fetch_and_decode_data(want_raw=True)
+
+        assert result == {'raw_data': {'data': self.sample_company_data}, 'processed_data': [{'company': 'new'}]}
+        mock_fetch_raw.assert_called_once()
+
     @patch('utils.fetch_raw_data')
     @patch('utils.flatten_and_standardize')
     @patch('utils.save_cache')
@@ -437,8 +761,29 @@ class TestUtils:
 
         result = utils.fetch_and_decode_data()
 
-        assert 'processed_data' in result
-        assert 'raw_data' in result  # Fixed: should be 'raw_data' not 'data'
+        # Same shape as a warm hit: the snapshot only comes back with want_raw
+        assert result == {'processed_data': [{'company': 'data'}]}
         mock_fetch_raw.assert_called_once()
         mock_flatten.assert_called_once()
-        mock_save_cache.assert_called_once()
+        # Processed companies and the raw snapshot go to separate caches,
+        # tagged with the same refresh
+        (raw_cache, raw_type), (data_cache,) = [c.args for c in mock_save_cache.call_args_list]
+        assert raw_type == 'raw'
+        assert raw_cache['snapshot'] == {'data': self.sample_company_data}
+        assert data_cache['processed_data'] == [{'company': 'data'}]
+        assert raw_cache['refresh'] == data_cache['refresh']
+
+    @patch('utils.fetch_raw_data')
+    @patch('utils.flatten_and_standardize')
+    @patch('utils.save_cache')
+    @patch('utils.load_cache')
+    def test_fetch_and_decode_data_fresh_want_raw(self, mock_load_cache, mock_save_cache,
+                                                 mock_flatten, mock_fetch_raw):
+        """Test a cold call with want_raw also returns the snapshot"""
+        mock_load_cache.return_value = None
+        mock_fetch_raw.return_value = {'data': self.sample_company_data}
+        mock_flatten.return_value = [{'company': 'data'}]
+
+        result = utils.fetch_and_decode_data(want_raw=True)
+
+        assert result == {'raw_data': {'data': self.sample_company_data}, 'processed_data': [{'company': 'data'}]}
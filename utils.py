@@ -1,13 +1,20 @@
+import atexit
 import requests
-import json
-import base64
+import orjson
+import pybase64
 import logging
 import os
 import re
-from cache_manager import load_cache, save_cache
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from cache_manager import CACHE_DURATIONS, load_cache, save_cache
 from dotenv import load_dotenv
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 load_dotenv()  # Load environment variables from .env file
@@ -15,10 +22,65 @@ load_dotenv()  # Load environment variables from .env file
 # Cache for stock tickers
 TICKER_CACHE_KEY = 'ticker'
 ticker_cache = load_cache(TICKER_CACHE_KEY) or {}
+# Guards ticker_cache updates made from the lookup thread pool
+_ticker_lock = threading.Lock()
+# Set when ticker_cache has entries not yet written to disk
+_ticker_dirty = False
+# Futures for uncached lookups in progress, keyed by company name
+_inflight_lookups = {}
+_inflight_lock = threading.Lock()
 
-def search_with_perplexity(query):
+# Entries are {'ticker': ticker or None, 'ts': epoch seconds}. A company
+# with no ticker is asked about again after a week, in case it has listed
+# or the lookup improves; found tickers last as long as the cache itself.
+TICKER_NEGATIVE_TTL = 7 * 86400
+TICKER_POSITIVE_TTL = CACHE_DURATIONS['ticker'].total_seconds()
+
+# Ticker lookups are network-bound, so they run concurrently during a refresh
+TICKER_LOOKUP_WORKERS = 16
+
+# Companies asked about per Perplexity request during a refresh, and the
+# reply budget allowed for each of them
+TICKER_BATCH_SIZE = 20
+TICKER_BATCH_TOKENS_PER_COMPANY = 20
+
+# Punctuation dropped from company names before they are searched
+_NAME_PUNCTUATION = str.maketrans('', '', '.,;:')
+
+# Answers meaning "no ticker"
+_NULL_ANSWERS = frozenset({'null', 'none', '-', 'n/a'})
+
+# (connect, read) timeout for every outbound call. A refresh can run
+# inside a request, and gunicorn kills workers after 30 seconds.
+HTTP_TIMEOUT = (5, 20)
+
+def _build_session():
+    """
+    Creates the shared HTTP session for Glide, Perplexity and OpenRouter calls.
+    Pooled keep-alive connections spare each request a TCP+TLS handshake;
+    the pool is sized for the ticker lookup workers.
+    Only GETs are retried: the POSTs are paid LLM completions (or the Glide
+    snapshot request), and a failed one already falls back elsewhere.
+    """
+    retry = Retry(
+        total=3,
+        backoff_factor=0.3,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset({'GET'}),
+        raise_on_status=False
+    )
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+_session = _build_session()
+
+def _perplexity_request(query, **options):
     """
-    Performs a search using Perplexity API
+    Sends query to the Perplexity chat completions API and returns the JSON reply.
+    Extra options are merged into the request payload. Raises on failure.
     """
     url = "https://api.perplexity.ai/chat/completions"
     headers = {
@@ -40,20 +102,94 @@ def search_with_perplexity(query):
         ],
         "temperature": 0.2,
         "max_tokens": 150,
-        "search_recency_filter": "month"
+        "search_recency_filter": "month",
+        # A ticker answer needs only a little retrieved context
+        "web_search_options": {"search_context_size": "low"},
+        **options
     }
     
+    response = _session.post(url, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
+@lru_cache(maxsize=4096)
+def _perplexity_completion(query):
+    """
+    Memoized single-query Perplexity call.
+    Raises on failure so that only successful replies are memoized.
+    """
+    return _perplexity_request(query)
+
+def search_with_perplexity(query):
+    """
+    Performs a search using Perplexity API.
+    Successful responses are memoized per query until the next refresh
+    (see clear_search_cache), so repeated queries within a refresh cost a
+    single request.
+    """
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        return response.json()
+        return _perplexity_completion(query)
     except Exception as e:
         logger.error(f"Perplexity API error: {str(e)}")
         return None
 
-def parse_ticker_with_openrouter(perplexity_response):
+def clear_search_cache():
     """
-    Uses OpenRouter with Gemini to parse ticker from Perplexity response
+    Forget memoized Perplexity responses and OpenRouter parses.
+    Called at the start of every refresh so each one re-asks the APIs.
+    """
+    _perplexity_completion.cache_clear()
+    _openrouter_ticker.cache_clear()
+
+# Reply shape for batched ticker lookups. It is the same for every batch,
+# so no company name ever ends up in a schema key.
+_TICKER_BATCH_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tickers": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "ticker": {"type": ["string", "null"]}
+                },
+                "required": ["name", "ticker"]
+            }
+        }
+    },
+    "required": ["tickers"]
+}
+
+def search_tickers_with_perplexity(company_names):
+    """
+    Asks Perplexity for the tickers of several companies in one request.
+    The reply is constrained to _TICKER_BATCH_SCHEMA: a list of name/ticker
+    pairs, with a null ticker for companies that have none. Returns the API
+    response, or None on error.
+    """
+    query = (
+        "For each of the following companies, what is its stock ticker symbol in the US "
+        "(NYSE, NASDAQ, OTC markets, or as an ADR)? Answer with a JSON object whose \"tickers\" "
+        "list has one {\"name\", \"ticker\"} entry per company, with the name exactly as given "
+        "and a null ticker if it is not publicly traded or the ticker is not found: "
+        f"{orjson.dumps(list(company_names)).decode()}"
+    )
+    try:
+        return _perplexity_request(
+            query,
+            max_tokens=TICKER_BATCH_TOKENS_PER_COMPANY * len(company_names),
+            response_format={"type": "json_schema", "json_schema": {"schema": _TICKER_BATCH_SCHEMA}}
+        )
+    except Exception as e:
+        logger.error(f"Perplexity batch API error: {str(e)}")
+        return None
+
+@lru_cache(maxsize=4096)
+def _openrouter_ticker(perplexity_response):
+    """
+    Memoized OpenRouter parse of one Perplexity reply.
+    Raises on failure so that only successful parses are memoized.
     """
     url = "https://openrouter.ai/api/v1/chat/completions"
     headers = {
@@ -78,23 +214,45 @@ Response:"""
             }
         ],
         "temperature": 0.1,
-        "max_tokens": 10
+        "max_tokens": 10,
+        # A ticker fits on one line; stop generating at the first newline
+        "stop": ["\n"]
     }
 
+    response = _session.post(url, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    result = response.json()
+
+    if 'choices' in result and len(result['choices']) > 0:
+        ticker = result['choices'][0]['message']['content'].strip()
+        logger.info(f"OpenRouter parsed ticker: {ticker}")
+        return ticker if ticker.lower() != 'null' else None
+    return None
+
+def parse_ticker_with_openrouter(perplexity_response):
+    """
+    Uses OpenRouter with Gemini to parse ticker from Perplexity response.
+    Parses are memoized per reply text, so different company names that get
+    the same Perplexity answer cost a single OpenRouter request.
+    """
     try:
-        response = requests.post(url, headers=headers, json=payload)
-        response.raise_for_status()
-        result = response.json()
-
-        if 'choices' in result and len(result['choices']) > 0:
-            ticker = result['choices'][0]['message']['content'].strip()
-            logger.info(f"OpenRouter parsed ticker: {ticker}")
-            return ticker if ticker.lower() != 'null' else None
-        return None
+        return _openrouter_ticker(perplexity_response)
     except Exception as e:
         logger.error(f"OpenRouter API error: {str(e)}")
         return None
 
+# Basic patterns for different types of tickers, fused into one compiled
+# alternation so each candidate is scanned once
+_TICKER_PATTERN = re.compile(r"""
+    ^(?:
+        [A-Z]{1,5}                          # Regular NYSE/NASDAQ
+      | [A-Z]{4,5}Y                         # ADRs ending in Y
+      | [A-Z]{2,6}F                         # Foreign ordinary shares
+      | [A-Z]{4,6}(?:\.[A-Z]{1,2})?         # OTC/ADR tickers (like ABBNY)
+      | [A-Z]{1,4}\d{1,2}(?:\.[A-Z]{1,2})?  # Tickers with numbers
+    )$
+""", re.VERBOSE)
+
 def is_valid_ticker(ticker):
     """
     Validates if a string looks like a valid stock ticker.
@@ -108,32 +266,84 @@ def is_valid_ticker(ticker):
     if not ticker or len(ticker) > 10:  # Allow longer tickers for OTC/ADR with exchange codes
         return False
     
-    # Basic patterns for different types of tickers
-    patterns = [
-        r'^[A-Z]{1,5}$',                    # Regular NYSE/NASDAQ
-        r'^[A-Z]{4,5}Y$',                   # ADRs ending in Y
-        r'^[A-Z]{2,6}F$',                   # Foreign ordinary shares
-        r'^[A-Z]{4,6}(\.[A-Z]{1,2})?$',    # OTC/ADR tickers (like ABBNY)
-        r'^[A-Z]{1,4}\d{1,2}(\.[A-Z]{1,2})?$'  # Tickers with numbers
-    ]
-    
-    return any(bool(re.match(pattern, ticker)) for pattern in patterns)
+    return _TICKER_PATTERN.match(ticker) is not None
+
+def _cached_ticker(company_name):
+    """
+    Returns (True, ticker) for a ticker_cache entry that is still valid,
+    otherwise (False, None).
+    Entries written before timestamps were stored are plain values: found
+    tickers are kept, while unknown-ticker results count as expired.
+    """
+    entry = ticker_cache.get(company_name)
+    if entry is None:
+        return False, None
+    if isinstance(entry, str):
+        return True, entry
+    ticker = entry.get('ticker')
+    ttl = TICKER_POSITIVE_TTL if ticker else TICKER_NEGATIVE_TTL
+    if time.time() - entry.get('ts', 0) <= ttl:
+        return True, ticker
+    return False, None
+
+def _cache_ticker(company_name, ticker):
+    """Record a ticker lookup result; it is persisted by flush_ticker_cache."""
+    global _ticker_dirty
+    with _ticker_lock:
+        ticker_cache[company_name] = {'ticker': ticker, 'ts': time.time()}
+        _ticker_dirty = True
+
+def flush_ticker_cache():
+    """Write the ticker cache to disk if it changed since the last flush."""
+    global _ticker_dirty
+    with _ticker_lock:
+        if _ticker_dirty:
+            save_cache(ticker_cache, TICKER_CACHE_KEY)
+            _ticker_dirty = False
+
+# Lookups made outside a refresh are persisted when the process exits
+atexit.register(flush_ticker_cache)
 
 def get_stock_ticker(company_name):
     """
     Uses Perplexity search to find the stock ticker for a publicly traded company.
-    Results are cached persistently to avoid redundant API calls.
+    Results are cached persistently to avoid redundant API calls, and concurrent
+    calls for the same uncached company share a single lookup.
     Returns None if the company is not publicly traded or if the ticker cannot be found.
     """
-    global ticker_cache
-    
     # Check cache first
-    if company_name in ticker_cache:
-        return ticker_cache[company_name]
-        
+    hit, ticker = _cached_ticker(company_name)
+    if hit:
+        return ticker
+
+    with _inflight_lock:
+        future = _inflight_lookups.get(company_name)
+        is_owner = future is None
+        if is_owner:
+            # An owner may have cached its result and finished since the
+            # check above
+            hit, ticker = _cached_ticker(company_name)
+            if hit:
+                return ticker
+            future = Future()
+            _inflight_lookups[company_name] = future
+    if not is_owner:
+        return future.result()
+
+    ticker = None
+    try:
+        ticker = _lookup_stock_ticker(company_name)
+    finally:
+        with _inflight_lock:
+            del _inflight_lookups[company_name]
+        future.set_result(ticker)
+    return ticker
+
+def _lookup_stock_ticker(company_name):
+    """Asks Perplexity (and OpenRouter to parse the reply) for one company's ticker."""
     try:
         # Clean company name
-        search_name = company_name.replace(".", "").replace(",", "")
+        search_name = company_name.translate(_NAME_PUNCTUATION)
         
         # Search focusing on major exchanges and ADRs
         search_query = f"What is the stock ticker symbol for {search_name} in the US (NYSE, NASDAQ, OTC markets, or as an ADR)? Only return the ticker symbol, no explanation. Return null if not found."
@@ -147,9 +357,8 @@ def get_stock_ticker(company_name):
         logger.info(f"Perplexity returned '{content}' for {company_name}")
 
         # Handle null-like responses
-        if content.lower().strip('.') in ['null', 'none', '-', 'n/a']:
-            ticker_cache[company_name] = None
-            save_cache(ticker_cache, TICKER_CACHE_KEY)
+        if content.lower().strip('.') in _NULL_ANSWERS:
+            _cache_ticker(company_name, None)
             return None
 
         # Use OpenRouter with Gemini to parse the ticker from Perplexity response
@@ -162,78 +371,178 @@ def get_stock_ticker(company_name):
         # Validate the ticker format
         if not is_valid_ticker(ticker):
             logger.warning(f"Invalid ticker format received for {company_name}: {ticker}")
-            ticker_cache[company_name] = None
-            save_cache(ticker_cache, TICKER_CACHE_KEY)
+            _cache_ticker(company_name, None)
             return None
         
         # Cache the result
-        ticker_cache[company_name] = ticker
-        save_cache(ticker_cache, TICKER_CACHE_KEY)
+        _cache_ticker(company_name, ticker)
         
         return ticker
     except Exception as e:
         logger.error(f"Error getting stock ticker for {company_name}: {str(e)}")
         return None
 
+def _parse_ticker_mapping(response, company_names):
+    """
+    Maps a batch reply back onto company_names as a name -> answer dict, or
+    returns None if the reply is unusable. Entries for names that were not
+    asked about are dropped; names are matched ignoring surrounding spaces.
+    """
+    try:
+        content = response['choices'][0]['message']['content']
+        # Tolerate prose or code fences around the object
+        start, end = content.index('{'), content.rindex('}') + 1
+        entries = orjson.loads(content[start:end])['tickers']
+    except (KeyError, IndexError, TypeError, ValueError):
+        return None
+    if not isinstance(entries, list):
+        return None
+    names = {name.strip(): name for name in company_names}
+    mapping = {}
+    for entry in entries:
+        if not isinstance(entry, dict) or not isinstance(entry.get('name'), str):
+            continue
+        name = names.get(entry['name'].strip())
+        if name is not None and 'ticker' in entry:
+            mapping.setdefault(name, entry['ticker'])
+    return mapping
+
+def _lookup_ticker_batch(company_names):
+    """
+    Resolves one batch of uncached names with a single Perplexity request.
+    Names the reply leaves out or answers with an invalid ticker go through
+    get_stock_ticker individually.
+    """
+    mapping = _parse_ticker_mapping(search_tickers_with_perplexity(company_names), company_names) or {}
+    tickers = {}
+    for name in company_names:
+        answer = mapping.get(name)
+        if isinstance(answer, str):
+            answer = answer.strip()
+            if answer.lower().strip('.') in _NULL_ANSWERS:
+                answer = None
+        if name in mapping and answer is None:
+            _cache_ticker(name, None)
+            tickers[name] = None
+        elif isinstance(answer, str) and is_valid_ticker(answer):
+            _cache_ticker(name, answer)
+            tickers[name] = answer
+        else:
+            tickers[name] = get_stock_ticker(name)
+    return tickers
+
+def get_stock_tickers(company_names):
+    """
+    Looks up tickers for many companies at once and returns a name -> ticker dict.
+    Cached names are answered from the ticker cache; the rest are sent to
+    Perplexity TICKER_BATCH_SIZE at a time, with the batches run concurrently.
+    """
+    tickers = {}
+    pending = []
+    for name in dict.fromkeys(company_names):
+        hit, ticker = _cached_ticker(name)
+        if hit:
+            tickers[name] = ticker
+        else:
+            pending.append(name)
+
+    batches = [pending[i:i + TICKER_BATCH_SIZE] for i in range(0, len(pending), TICKER_BATCH_SIZE)]
+    if batches:
+        with ThreadPoolExecutor(max_workers=min(TICKER_LOOKUP_WORKERS, len(batches))) as executor:
+            for batch_tickers in executor.map(_lookup_ticker_batch, batches):
+                tickers.update(batch_tickers)
+    return tickers
+
+# Source columns, in the order sources are listed
+_SOURCE_FIELDS = ('Source', 'Second source', 'Information source 3', 'Information source 4')
+
+# Complicity category fields and the row keys they are stored under
+_CATEGORY_KEYS = tuple(
+    (category, category.lower().replace(' ', '_'))
+    for category in ["Military", "Settlement production", "Population control", "Economic exploitation", "Cultural"]
+)
+
+_MISSING = object()
+
+def _intern(value):
+    """Intern string values so repeated labels share one object."""
+    return sys.intern(value) if isinstance(value, str) else value
+
+def _build_company(d, ticker):
+    """Builds the standardized entry for one Sheet1 row's data dict."""
+    # Get all sources in order
+    sources = [d[field] for field in _SOURCE_FIELDS if d.get(field)]
+
+    company = {
+        'companyName': d['Company Name'],
+        'companyId': d['Company name'],
+        'sector': _intern(d['Sector']),
+        'complicityDetails': d['Complicity details'],
+        'recordLastUpdated': d['Record last updated']['repr'],
+        'sources': sources,  # Add sources array
+        'stockTicker': ticker  # Add stock ticker
+    }
+    #Add complicity categories. Note that some categories may be absent.
+    for category, key in _CATEGORY_KEYS:
+        value = d.get(category, _MISSING)
+        if value is not _MISSING:
+            company[key] = _intern(value)
+    return company
+
 def flatten_and_standardize(data):
     """
     Flattens and standardizes the input JSON data into a list of JSON entries 
     representing companies and their associated data.
+    Sector and complicity category values come from a handful of labels, so
+    they are interned and every company shares the same string objects.
     """
 
-    companies = []
+    # Look up tickers for all companies in batched requests before building
+    # rows; a company listed more than once is only looked up once
+    names = list(dict.fromkeys(company_data['data']['Company Name'] for company_data in data['Sheet1']))
+    tickers = get_stock_tickers(names)
+    # One write for the whole batch instead of one per looked-up company
+    flush_ticker_cache()
+
     # Process Sheet1 data
-    for company_data in data['Sheet1']:
-        # Get all sources in order
-        sources = []
-        source_fields = ['Source', 'Second source', 'Information source 3', 'Information source 4']
-        for field in source_fields:
-            value = company_data['data'].get(field, '')
-            if value:
-                sources.append(value)
-
-        company = {
-            'companyName': company_data['data']['Company Name'],
-            'companyId': company_data['data']['Company name'],
-            'sector': company_data['data']['Sector'],
-            'complicityDetails': company_data['data']['Complicity details'],
-            'recordLastUpdated': company_data['data']['Record last updated']['repr'],
-            'sources': sources,  # Add sources array
-            'stockTicker': get_stock_ticker(company_data['data']['Company Name'])  # Add stock ticker
-        }
-        #Add complicity categories. Note that some categories may be absent.
-        for category in ["Military", "Settlement production", "Population control", "Economic exploitation", "Cultural"]:
-            if category in company_data['data']:
-                company[category.lower().replace(' ', '_')] = company_data['data'][category]
-        companies.append(company)
+    companies = [
+        _build_company(company_data['data'], tickers[company_data['data']['Company Name']])
+        for company_data in data['Sheet1']
+    ]
 
+    # Index companies by id so each campaign link is a dict lookup; the first
+    # company with a given id wins, as with the previous linear scan
+    companies_by_id = {}
+    for company in companies:
+        companies_by_id.setdefault(company['companyId'], company)
 
     # Process Campaigns data, adding campaign-related information to companies
     for campaign_data in data['Campaigns']:
+        campaign_info = campaign_data['data']
         # Check if 'Companies' field exists in campaign data
-        companies_field = campaign_data['data'].get('Companies', '')
+        companies_field = campaign_info.get('Companies', '')
         if not companies_field:
             logger.warning(f"Campaign {campaign_data.get('id', 'unknown')} has no 'Companies' field, skipping")
             continue
 
-        print(companies_field)
-        company_ids = [x.strip() for x in companies_field.split(',')] #Handle potential multiple companies
+        logger.debug("Campaign companies: %s", companies_field)
+        # Handle potential multiple companies; repeats and blank entries are dropped
+        company_ids = {company_id for company_id in map(str.strip, companies_field.split(',')) if company_id}
         for company_id in company_ids:
-            for i, company in enumerate(companies):
-                if company['companyId'] == company_id:
-                    campaign_info = campaign_data['data']
-                    company['campaignName'] = campaign_info.get('Campaign Name', '')
-                    company['campaignId'] = campaign_data['id']
-                    company['campaignDescription'] = campaign_info.get('Description', '')
-                    company['campaignLocation'] = campaign_info.get('Location', '')
-                    company['campaignOutcomes'] = campaign_info.get('Outcomes', '')
-                    company['campaignAimsAchieved'] = campaign_info.get('Aims achieved', '')
-                    company['campaignGroups'] = campaign_info.get('Campaign Groups', '')
-                    company['campaignMethods'] = campaign_info.get('9f119b48c6e3251dc6be2ae8a8b969c4', '')
-                    campaign_links = campaign_info.get('Campaign link', {}).get('$arrayItems', [])
-                    company['campaignLinks'] = [item for item in campaign_links if item]
-                    company['targetAim'] = campaign_info.get('Target aim: Divestment,Contract,Sponsor,Supply,Operations,Position,Other', '')
-                    break
+            company = companies_by_id.get(company_id)
+            if company is None:
+                continue
+            company['campaignName'] = campaign_info.get('Campaign Name', '')
+            company['campaignId'] = campaign_data['id']
+            company['campaignDescription'] = campaign_info.get('Description', '')
+            company['campaignLocation'] = campaign_info.get('Location', '')
+            company['campaignOutcomes'] = campaign_info.get('Outcomes', '')
+            company['campaignAimsAchieved'] = campaign_info.get('Aims achieved', '')
+            company['campaignGroups'] = campaign_info.get('Campaign Groups', '')
+            company['campaignMethods'] = campaign_info.get('9f119b48c6e3251dc6be2ae8a8b969c4', '')
+            campaign_links = campaign_info.get('Campaign link', {}).get('$arrayItems', [])
+            company['campaignLinks'] = [item for item in campaign_links if item]
+            company['targetAim'] = campaign_info.get('Target aim: Divestment,Contract,Sponsor,Supply,Operations,Position,Other', '')
 
     return companies
 
@@ -249,37 +558,60 @@ def fetch_raw_data():
     }
     payload = {"appID": "57dVVMXNFIuBOYtiLIaP"}
 
-    response = requests.post(url, headers=headers, json=payload)
+    response = _session.post(url, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
     response.raise_for_status()
     
     data_snapshot_url = response.json().get('dataSnapshot')
     if not data_snapshot_url:
         raise ValueError("dataSnapshot URL not found in response")
     
-    snapshot_response = requests.get(data_snapshot_url)
+    snapshot_response = _session.get(data_snapshot_url, timeout=HTTP_TIMEOUT)
     snapshot_response.raise_for_status()
     
-    decoded_bytes = base64.b64decode(snapshot_response.text)
-    return json.loads(decoded_bytes)
+    # pybase64 decodes with SIMD; same semantics as base64.b64decode.
+    # Decode the raw body bytes: going through .text would copy the whole
+    # snapshot into a str first.
+    decoded_bytes = pybase64.b64decode(snapshot_response.content)
+    return orjson.loads(decoded_bytes)
 
-def fetch_and_decode_data():
-    """Main function to fetch and process data with caching"""
+def fetch_and_decode_data(want_raw=False):
+    """
+    Main function to fetch and process data with caching.
+    Returns {'processed_data': ...}; with want_raw the raw snapshot is
+    included as 'raw_data'. The two are cached separately, both tagged with
+    the refresh they came from, so a snapshot left over from an earlier
+    refresh is never paired with newer processed data.
+    """
     cached_data = load_cache()
     if cached_data and 'processed_data' in cached_data:
-        logger.info("Returning processed data from cache")
-        return {'data': cached_data['raw_data'], 'processed_data': cached_data['processed_data']}
+        if not want_raw:
+            logger.info("Returning processed data from cache")
+            return {'processed_data': cached_data['processed_data']}
+        # Data caches written before the split still carry the snapshot
+        raw_data = cached_data.get('raw_data')
+        if raw_data is None:
+            raw_cache = load_cache('raw')
+            if raw_cache and raw_cache.get('refresh') == cached_data.get('refresh'):
+                raw_data = raw_cache['snapshot']
+        if raw_data is not None:
+            logger.info("Returning raw and processed data from cache")
+            return {'raw_data': raw_data, 'processed_data': cached_data['processed_data']}
 
     try:
+        # Each refresh asks the APIs afresh; otherwise a long-lived worker
+        # would replay memoized replies for names whose cache entry expired
+        clear_search_cache()
         decoded_json = fetch_raw_data()
         processed_data = flatten_and_standardize(decoded_json['data'])
         
-        cache_data = {
-            'raw_data': decoded_json,
-            'processed_data': processed_data
-        }
-        save_cache(cache_data)
+        refresh = time.time()
+        save_cache({'refresh': refresh, 'snapshot': decoded_json}, 'raw')
+        save_cache({'refresh': refresh, 'processed_data': processed_data})
         
-        return cache_data
+        result = {'processed_data': processed_data}
+        if want_raw:
+            result['raw_data'] = decoded_json
+        return result
         
     except requests.exceptions.RequestException as e:
         logger.error(f"Request failed: {str(e)}")